@@ -0,0 +1,288 @@
+"""Pluggable compute backend for the aggregations behind the report pages.
+
+Every page is built from four aggregations of the fact table: the cube
+(monthly trends, top categories and the other Overview and Business
+Questions tables, see cube.build_cube), the per-state totals
+(geo.state_totals), the RFM stats per unique customer
+(rfm.customer_stats) and the product stats (products.product_stats).
+They run on pandas/numpy by default; with DASHBOARD_BACKEND=duckdb, and
+duckdb installed, they run as SQL on DuckDB, an embedded multi-threaded
+engine that scans the fact columns in place. Each module keeps its pandas
+implementation and asks ``query`` for the active backend's replacement
+first.
+
+Both backends return the same tables, with the same dtypes and row
+order; floating-point sums may differ in the last bits since the
+summation order differs. The parity report checks this and times each
+backend on the same model:
+
+    python dashboard/backend.py [data_path]
+"""
+import contextlib
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+BACKENDS = ["pandas", "duckdb"]
+
+# Backend of the page aggregations (override with DASHBOARD_BACKEND)
+BACKEND = os.environ.get("DASHBOARD_BACKEND", "pandas")
+
+# Worker threads of the DuckDB backend; 0 lets DuckDB use every core
+THREADS = int(os.environ.get("DASHBOARD_BACKEND_THREADS", 0))
+
+# Set by use(); takes precedence over BACKEND
+_selected = None
+
+
+def available():
+    """Backends that can run here"""
+    return [name for name in BACKENDS if name == "pandas" or duckdb is not None]
+
+
+def active():
+    """Backend in use: the one selected by use() or DASHBOARD_BACKEND, or
+    pandas when that one is not installed"""
+    name = _selected or BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend {name!r}; expected one of {BACKENDS}")
+    return name if name in available() else "pandas"
+
+
+@contextlib.contextmanager
+def use(name):
+    """Run the aggregations in this block on backend ``name``"""
+    global _selected
+    previous, _selected = _selected, name
+    try:
+        yield
+    finally:
+        _selected = previous
+
+
+def query(name):
+    """The active backend's implementation of aggregation ``name`` (see
+    QUERIES), or None when the caller's own pandas code should run"""
+    backend = active()
+    return None if backend == "pandas" else QUERIES[backend][name]
+
+
+def _sql(sql, **frames):
+    """Result of ``sql`` over ``frames``, registered as tables by name"""
+    con = duckdb.connect(config={"threads": THREADS} if THREADS else {})
+    try:
+        for name, frame in frames.items():
+            con.register(name, frame)
+        return con.execute(sql).df()
+    finally:
+        con.close()
+
+
+def _dense(result, key, size, columns):
+    """Per-key ``columns`` of a grouped ``result`` spread over keys 0..size-1
+    (zero for keys without rows)"""
+    keys = result[key].to_numpy(dtype=np.int64)
+    data = {}
+    for col, dtype in columns.items():
+        values = np.zeros(size, dtype=dtype)
+        values[keys] = result[col].to_numpy(dtype=dtype)
+        data[col] = values
+    return data
+
+
+def _order_by(dims):
+    # pandas sorts the groups with missing values last on every level
+    return ", ".join(f"{dim} NULLS LAST" for dim in dims)
+
+
+def _fact(model, columns, rows):
+    fact = model.fact if rows is None else model.fact.iloc[rows]
+    return fact[columns]
+
+
+def duckdb_build_cube(model, rows=None):
+    """cube.build_cube on DuckDB"""
+    import cube
+
+    df = model.select(cube.SOURCE_COLS, rows)
+    items = _sql(f"""
+        SELECT {", ".join(cube.DIMENSIONS)}, count(*) AS item_count, sum(price) AS revenue,
+               sum(freight_value) AS freight, count(review_score) AS reviews,
+               coalesce(sum(review_score::DOUBLE), 0) AS review_sum,
+               coalesce(sum(review_score::DOUBLE * review_score::DOUBLE), 0) AS review_sq
+        FROM df GROUP BY ALL ORDER BY {_order_by(cube.DIMENSIONS)}
+    """, df=df)
+    distinct = {}
+    for table in ["orders", "category_orders"]:
+        dims = cube.TABLES[table][0]
+        distinct[table] = _sql(f"""
+            SELECT {", ".join(dims)}, count(DISTINCT order_key) AS orders
+            FROM df GROUP BY ALL ORDER BY {_order_by(dims)}
+        """, df=df)
+    tables = {"items": items, **distinct}
+    for name, table in tables.items():
+        dtypes = dict(df.dtypes[cube.TABLES[name][0]])
+        dtypes.update({col: "int64" for col in ["item_count", "reviews", "orders"] if col in table})
+        tables[name] = table.astype(dtypes)
+    return cube.Cube(key_counts=cube.key_counts(model, df),
+                     first_date=model["dates"]["order_date"].iloc[0], **tables)
+
+
+def duckdb_customer_stats(model, customers=None, rows=None):
+    """rfm.customer_stats on DuckDB"""
+    import rfm
+
+    fact = _fact(model, rfm.FACT_COLUMNS, rows)
+    identity = rfm.unique_customers(model)[0]
+    fact = fact.assign(customer_unique_key=identity[fact["customer_key"].to_numpy()])
+    wanted = pd.DataFrame({"customer_unique_key": np.asarray([] if customers is None else customers,
+                                                             dtype=np.int32)})
+    only = "" if customers is None else \
+        "AND customer_unique_key IN (SELECT customer_unique_key FROM wanted)"
+    stats = _sql(f"""
+        SELECT customer_unique_key, max(order_purchase_timestamp) AS last_purchase,
+               count(DISTINCT order_key) AS Frequency, sum(price) AS Monetary
+        FROM fact WHERE order_status = 'delivered' AND customer_unique_key >= 0 {only}
+        GROUP BY customer_unique_key ORDER BY customer_unique_key
+    """, fact=fact, wanted=wanted)
+    # set_index would widen an empty key column to int64
+    key = pd.Index(stats.pop("customer_unique_key").to_numpy(dtype=np.int32),
+                   name="customer_unique_key")
+    return stats.astype({"last_purchase": fact["order_purchase_timestamp"].dtype,
+                         "Frequency": "int64", "Monetary": "float64"}).set_axis(key)
+
+
+def duckdb_state_totals(model, index, rows=None):
+    """geo.state_totals on DuckDB: customers reach their state through a
+    join on the zip prefix instead of a binary search"""
+    import geo
+
+    fact = _fact(model, geo.FACT_COLUMNS, rows)
+    zips = model["customers"]["customer_zip_code_prefix"].to_numpy()
+    customers = pd.DataFrame({"customer_key": np.arange(len(zips)), "zip": zips})
+    known = index.state_codes >= 0
+    places = pd.DataFrame({"zip": index.zips[known], "state": index.state_codes[known],
+                           "lat": index.lat[known], "lng": index.lng[known]})
+    totals = _sql("""
+        SELECT p.state, count(*) AS orders, sum(f.price) AS revenue,
+               count(f.review_score) AS reviews,
+               coalesce(sum(f.review_score::DOUBLE), 0) AS review_sum,
+               sum(p.lat::DOUBLE) AS lat_sum, sum(p.lng::DOUBLE) AS lng_sum
+        FROM fact f JOIN customers c USING (customer_key) JOIN places p USING (zip)
+        GROUP BY p.state
+    """, fact=fact, customers=customers, places=places)
+    columns = {"orders": "int64", "revenue": "float64", "reviews": "int64",
+               "review_sum": "float64", "lat_sum": "float64", "lng_sum": "float64"}
+    return pd.DataFrame(_dense(totals, "state", len(index.states), columns),
+                        index=pd.Index(index.states, name="State"))
+
+
+def duckdb_product_stats(model, rows=None):
+    """products.product_stats on DuckDB"""
+    import products
+
+    fact = _fact(model, products.FACT_COLUMNS, rows)
+    stats = _sql("""
+        SELECT product_key, count(*) AS items, sum(price) AS price_sum,
+               count(review_score) AS reviews,
+               coalesce(sum(review_score::DOUBLE), 0) AS review_sum
+        FROM fact GROUP BY product_key
+    """, fact=fact)
+    columns = {"items": "int64", "price_sum": "float64", "reviews": "int64", "review_sum": "float64"}
+    return pd.DataFrame(_dense(stats, "product_key", len(model["products"]), columns)
+                        ).rename_axis("product_key")
+
+
+# Aggregations each non-pandas backend replaces, by name
+QUERIES = {
+    "duckdb": {
+        "cube": duckdb_build_cube,
+        "customer_stats": duckdb_customer_stats,
+        "state_totals": duckdb_state_totals,
+        "product_stats": duckdb_product_stats,
+    },
+}
+
+
+def _aggregations(index):
+    """Each aggregation as a function of the model, by name"""
+    import cube
+    import geo
+    import products
+    import rfm
+
+    result = {"cube": cube.build_cube, "customer_stats": rfm.customer_stats,
+              "product_stats": products.product_stats}
+    if index is not None:
+        result["state_totals"] = lambda model: geo.state_totals(model, index)
+    return result
+
+
+def _frames(result):
+    """The DataFrames of an aggregation result, by name"""
+    if isinstance(result, pd.DataFrame):
+        return {"": result}
+    frames = {name: getattr(result, name) for name in ["items", "orders", "category_orders"]}
+    frames.update({f"key_counts.{name}": pd.DataFrame({name: counts})
+                   for name, counts in result.key_counts.items()})
+    return frames
+
+
+def same_result(expected, result):
+    """Whether two aggregation results are equal: same tables, dtypes and
+    row order, floats up to summation order"""
+    expected, result = _frames(expected), _frames(result)
+    if expected.keys() != result.keys():
+        return False
+    try:
+        for name, frame in expected.items():
+            pd.testing.assert_frame_equal(frame, result[name], check_exact=False, rtol=1e-9)
+    except AssertionError:
+        return False
+    return True
+
+
+def parity_report(data_path, repeat=3):
+    """Best-of-``repeat`` seconds of every aggregation per available backend,
+    and whether its result matches the pandas one"""
+    import geo
+    import incremental
+
+    model, _ = incremental.refresh(data_path)
+    try:
+        index = geo.load_geo_index(data_path)
+    except FileNotFoundError:
+        index = None
+    expected = {}
+    report = []
+    for backend in available():
+        with use(backend):
+            for name, run in _aggregations(index).items():
+                seconds = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    result = run(model)
+                    seconds.append(time.perf_counter() - start)
+                # pandas runs first and sets the reference
+                expected.setdefault(name, result)
+                report.append({"aggregation": name, "backend": backend, "seconds": min(seconds),
+                               "matches_pandas": same_result(expected[name], result)})
+    return pd.DataFrame(report).pivot(index="aggregation", columns="backend")
+
+
+if __name__ == "__main__":
+    import ingest
+
+    path = sys.argv[1] if len(sys.argv) > 1 else ingest.find_data_path()
+    if path is None:
+        sys.exit("orders_dataset.csv not found")
+    print(f"backends available: {', '.join(available())}")
+    print(parity_report(path).to_string())
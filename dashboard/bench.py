@@ -0,0 +1,188 @@
+"""Scale benchmark: ingestion and every report page on synthetic datasets.
+
+Generates (or reuses) an Olist-shaped dataset per scale with synth.py,
+then times each stage over a few repeats and measures its peak Python
+memory in a separate tracemalloc pass, since tracing slows the code
+it measures:
+
+    python dashboard/bench.py --scales 1 10 --repeat 3
+    python dashboard/bench.py compare bench_results/a.json bench_results/b.json
+
+Stages are "build" (CSV parse, star schema, artifacts and snapshot write,
+starting from an empty cache), "load" (opening the snapshot; its tables
+and artifacts are read by the first page stage that uses them), one per
+page of report.PAGES and "build_streaming" (the same build out of core,
+see stream.py). Results go to bench_results/ as JSON, together with the git
+commit and library versions, so runs on different commits compare.
+"""
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import backend
+import incremental
+import ingest
+import report
+import synth
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+RESULTS_DIR = "bench_results"
+DATA_DIR = "bench_data"
+
+
+def _clear_cache(data_path):
+    shutil.rmtree(ingest.cache_dir(data_path), ignore_errors=True)
+
+
+def stages(data_path):
+    """(name, setup, run) per stage; setup runs untimed before each repeat"""
+    state = {}
+
+    def load():
+        state["model"], _ = incremental.refresh(data_path)
+
+    result = [("build", lambda: _clear_cache(data_path), load),
+              ("load", None, load)]
+    for page in report.PAGES:
+        result.append((page, None,
+                       lambda page=page: report.compute_page(state["model"], page, data_path)))
+    # Out-of-core build last: it replaces the in-memory snapshot
+    result.append(("build_streaming", lambda: _clear_cache(data_path),
+                   lambda: incremental.refresh(data_path, streaming=True)))
+    return result
+
+
+def time_stage(setup, run, repeat):
+    wall, cpu = [], []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start, start_cpu = time.perf_counter(), time.process_time()
+        run()
+        wall.append(time.perf_counter() - start)
+        cpu.append(time.process_time() - start_cpu)
+    return {"wall_s": min(wall), "wall_median_s": float(np.median(wall)), "cpu_s": min(cpu)}
+
+
+def peak_memory(setup, run):
+    """Peak traced allocation of one run, in MiB"""
+    if setup:
+        setup()
+    tracemalloc.start()
+    try:
+        run()
+        return tracemalloc.get_traced_memory()[1] / 2 ** 20
+    finally:
+        tracemalloc.stop()
+
+
+def bench_dataset(data_path, repeat=3, memory=True):
+    """Timings (and peak memory) of every stage on one dataset"""
+    results = {}
+    for name, setup, run in stages(data_path):
+        results[name] = time_stage(setup, run, repeat)
+        if memory:
+            results[name]["peak_mib"] = peak_memory(setup, run)
+        print(f"  {name:<20} {results[name]['wall_s']:>8.3f}s"
+              + (f" {results[name]['peak_mib']:>9.1f} MiB" if memory else ""))
+    return results
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "commit": commit or None,
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "pyarrow": ingest.HAS_PYARROW,
+        "backend": backend.active(),
+        "machine": platform.machine(),
+        "processor": platform.processor() or None,
+        "cpus": os.cpu_count(),
+    }
+
+
+def run_bench(scales, repeat=3, seed=0, data_dir=DATA_DIR, out_dir=RESULTS_DIR, memory=True):
+    """Benchmark every scale and write the results file; returns its path"""
+    results = {"generated_at": datetime.datetime.now().isoformat(timespec="seconds"),
+               "environment": environment(), "repeat": repeat, "seed": seed,
+               "generator_version": synth.GENERATOR_VERSION, "scales": {}}
+    for scale in scales:
+        data_path = os.path.join(data_dir, f"{scale:g}x")
+        rows = synth.ensure_dataset(data_path, scale, seed)
+        print(f"scale {scale:g}x: {rows['orders']:,} orders, {rows['order_items']:,} items")
+        results["scales"][f"{scale:g}"] = {"rows": rows,
+                                           "stages": bench_dataset(data_path, repeat, memory)}
+    if resource is not None:
+        # KiB on Linux, bytes on macOS
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        results["max_rss_mib"] = maxrss / (2 ** 20 if sys.platform == "darwin" else 2 ** 10)
+
+    os.makedirs(out_dir, exist_ok=True)
+    name = f"{datetime.datetime.now():%Y%m%d-%H%M%S}-{results['environment']['commit'] or 'local'}.json"
+    path = os.path.join(out_dir, name)
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+    return path
+
+
+def compare(base_path, new_path):
+    """Print the wall time and peak memory of two result files side by side"""
+    with open(base_path) as f:
+        base = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    print(f"{'scale':>6} {'stage':<20} {'base s':>9} {'new s':>9} {'ratio':>6}"
+          f" {'base MiB':>9} {'new MiB':>9}")
+    for scale, run in new["scales"].items():
+        if scale not in base["scales"]:
+            continue
+        old_stages = base["scales"][scale]["stages"]
+        for stage, stats in run["stages"].items():
+            old = old_stages.get(stage)
+            if old is None:
+                continue
+            ratio = stats["wall_s"] / old["wall_s"] if old["wall_s"] else float("nan")
+            print(f"{scale:>6} {stage:<20} {old['wall_s']:>9.3f} {stats['wall_s']:>9.3f} {ratio:>6.2f}"
+                  f" {old.get('peak_mib', float('nan')):>9.1f} {stats.get('peak_mib', float('nan')):>9.1f}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    if len(sys.argv) > 1 and sys.argv[1] == "compare":
+        if len(sys.argv) != 4:
+            sys.exit("usage: bench.py compare BASE.json NEW.json")
+        compare(sys.argv[2], sys.argv[3])
+        sys.exit()
+
+    parser = argparse.ArgumentParser(description="Benchmark ingestion and report pages at scale")
+    parser.add_argument("--scales", nargs="+", type=float, default=[1.0],
+                        help="dataset sizes as multiples of the public dataset (e.g. 1 10 100)")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per stage (best is kept)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", default=DATA_DIR, help="where generated datasets are kept")
+    parser.add_argument("--out", default=RESULTS_DIR, help="folder for the results JSON")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    args = parser.parse_args()
+
+    path = run_bench(args.scales, args.repeat, args.seed, args.data_dir, args.out, not args.no_memory)
+    print(f"wrote {path}")
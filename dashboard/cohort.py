@@ -0,0 +1,121 @@
+"""Cohort retention: unique customers grouped by their first-purchase month"""
+import numpy as np
+import pandas as pd
+
+import rfm
+
+# Fact columns customer_months reads
+FACT_COLUMNS = ["customer_key", "order_key", "order_status", "order_purchase_timestamp", "price"]
+
+
+def month_codes(fact):
+    """Months since 1970-01 (a monthly Period's ordinal) of each fact row's purchase"""
+    return fact["order_purchase_timestamp"].to_numpy().astype("datetime64[M]").astype(np.int64)
+
+
+def _fold(person, month, orders, revenue):
+    """Orders and revenue summed per (customer, month), sorted by customer then month"""
+    if not len(person):
+        return pd.DataFrame({"customer_unique_key": np.empty(0, dtype=np.int32),
+                             "month": np.empty(0, dtype=np.int32),
+                             "orders": np.empty(0, dtype=np.int64),
+                             "revenue": np.empty(0, dtype=np.float64)})
+    # One integer per (customer, month) pair, so a single sort groups them
+    lo = month.min()
+    span = int(month.max() - lo + 1)
+    pairs, inverse = np.unique(person.astype(np.int64) * span + (month - lo), return_inverse=True)
+    return pd.DataFrame({
+        "customer_unique_key": (pairs // span).astype(np.int32),
+        "month": (pairs % span + lo).astype(np.int32),
+        "orders": np.bincount(inverse, weights=orders, minlength=len(pairs)).astype(np.int64),
+        "revenue": np.bincount(inverse, weights=revenue, minlength=len(pairs)).astype(np.float64),
+    })
+
+
+def customer_months(model, customers=None, rows=None):
+    """Delivered orders and spend of every unique customer in each month
+    they bought in, sorted by customer then month.
+
+    This is the cohort input kept as a model artifact; as with
+    rfm.customer_stats, ``customers`` restricts it to those unique-customer
+    keys so an incremental drop only recomputes the customers it touched,
+    and ``rows`` restricts the fact rows.
+    """
+    fact = model.fact if rows is None else model.fact.iloc[rows]
+    person = rfm.unique_customers(model)[0][fact["customer_key"].to_numpy()]
+    mask = ((fact["order_status"] == "delivered").to_numpy() & (person >= 0)
+            & ~np.isnat(fact["order_purchase_timestamp"].to_numpy()))
+    if customers is not None:
+        wanted = np.zeros(len(rfm.unique_customers(model)[1]), dtype=bool)
+        wanted[customers] = True
+        mask &= wanted[person]
+    order_key = fact["order_key"].to_numpy()[mask]
+    # An order's items sit together in the fact (see star.assemble_fact)
+    first = np.ones(len(order_key), dtype=bool)
+    first[1:] = order_key[1:] != order_key[:-1]
+    return _fold(person[mask], month_codes(fact)[mask], first,
+                 fact["price"].to_numpy(dtype=np.float64)[mask])
+
+
+def merge_months(months, other):
+    """Customer months of two disjoint sets of fact rows, combined"""
+    merged = pd.concat([months, other], ignore_index=True)
+    return _fold(merged["customer_unique_key"].to_numpy(), merged["month"].to_numpy(),
+                 merged["orders"].to_numpy(), merged["revenue"].to_numpy())
+
+
+def patch_months(months, new, customers):
+    """``months`` with the rows of unique-customer keys ``customers``
+    recomputed from model ``new``"""
+    kept = months[~np.isin(months["customer_unique_key"].to_numpy(), customers)]
+    return merge_months(kept, customer_months(new, customers))
+
+
+def retention(months):
+    """Cohort x months-since-first-purchase matrices of a customer-months table.
+
+    Returns DataFrames indexed by cohort (first-purchase month, "YYYY-MM")
+    with one column per month since: "customers" active, their "revenue",
+    and "retention", the active share of the cohort. Months after the last
+    purchase month have not been observed yet and are NaN in "retention".
+    """
+    person = months["customer_unique_key"].to_numpy()
+    month = months["month"].to_numpy().astype(np.int64)
+    if not len(person):
+        empty = pd.DataFrame(index=pd.Index([], name="cohort"))
+        return {"customers": empty, "revenue": empty, "retention": empty}
+    # Rows are sorted by customer then month: a customer's first row is its cohort
+    starts = np.ones(len(person), dtype=bool)
+    starts[1:] = person[1:] != person[:-1]
+    cohort = month[np.maximum.accumulate(np.where(starts, np.arange(len(person)), 0))]
+
+    lo, hi = int(month.min()), int(month.max())
+    n = hi - lo + 1
+    cell = (cohort - lo) * n + (month - cohort)
+    active = np.bincount(cell, minlength=n * n).reshape(n, n)
+    revenue = np.bincount(cell, weights=months["revenue"].to_numpy(), minlength=n * n).reshape(n, n)
+
+    labels = pd.period_range(pd.Period(ordinal=lo, freq="M"), periods=n, freq="M").strftime("%Y-%m")
+    index, columns = pd.Index(labels, name="cohort"), pd.RangeIndex(n, name="months_since")
+    observed = np.arange(n)[:, None] + np.arange(n)[None, :] < n
+    with np.errstate(invalid="ignore", divide="ignore"):
+        share = np.where(observed, active / active[:, :1], np.nan)
+    # Months without a first purchase are not cohorts
+    has = active[:, 0] > 0
+    return {
+        "customers": pd.DataFrame(active, index=index, columns=columns)[has],
+        "revenue": pd.DataFrame(revenue, index=index, columns=columns)[has],
+        "retention": pd.DataFrame(share, index=index, columns=columns)[has],
+    }
+
+
+def cohort_tables(model, rows=None):
+    """Retention matrices of the model (see retention).
+
+    ``rows`` restricts the fact rows, so a date window's cohorts are its
+    customers' first purchases inside it; the "cohorts" artifact covers them all.
+    """
+    months = model.artifacts.get("cohorts") if rows is None else None
+    if months is None:
+        months = customer_months(model, rows=rows)
+    return months, retention(months)
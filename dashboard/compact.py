@@ -0,0 +1,78 @@
+"""Compact in-memory representation of the dashboard frames"""
+import numpy as np
+import pandas as pd
+
+# 32-char hex keys that are interned to dense integer codes
+ID_COLS = ["order_id", "customer_id", "customer_unique_id", "product_id", "seller_id"]
+
+# Low-cardinality text columns stored as categoricals
+CATEGORY_COLS = ["order_status", "customer_city", "customer_state",
+                 "seller_city", "seller_state",
+                 "product_category_name", "product_category_name_english"]
+
+# Timestamps the loader leaves as text
+DATE_COLS = ["order_delivered_carrier_date", "shipping_limit_date", "review_creation_date"]
+
+# Narrow dtypes for the remaining numeric columns
+NARROW_DTYPES = {
+    "review_score": "Int8",
+    "order_year": "int16",
+    "order_month": "int8",
+    "order_item_id": "int16",
+    "customer_zip_code_prefix": "int32",
+    "delivery_time": "float32",
+    "estimated_time": "float32",
+    "product_name_lenght": "float32",
+    "product_description_lenght": "float32",
+    "product_photos_qty": "float32",
+    "product_weight_g": "float32",
+    "product_length_cm": "float32",
+    "product_height_cm": "float32",
+    "product_width_cm": "float32",
+}
+
+
+class IdCodec:
+    """Interns hex IDs to dense int32 codes"""
+
+    def __init__(self, values):
+        self.index = pd.Index(pd.unique(np.asarray(values, dtype=object)))
+
+    def __len__(self):
+        return len(self.index)
+
+    def encode(self, values):
+        """Codes for ``values``; IDs the codec has never seen map to -1"""
+        return self.index.get_indexer(values).astype(np.int32)
+
+    def categorical(self, values):
+        """``values`` as a categorical sharing this codec's code space"""
+        return pd.Categorical.from_codes(self.encode(values), categories=self.index)
+
+    @classmethod
+    def from_unique(cls, values):
+        """Codec over values known to be unique, such as a dimension's ID column"""
+        codec = cls.__new__(cls)
+        codec.index = pd.Index(values)
+        return codec
+
+
+def compact_frame(df, codecs=None):
+    """Return ``df`` with interned IDs, categorical dimensions and narrow dtypes.
+
+    Only ID columns with a codec in ``codecs`` are interned.
+    """
+    df = df.copy()
+    for col in ID_COLS:
+        if col in df.columns and codecs and col in codecs:
+            df[col] = codecs[col].categorical(df[col])
+    for col in CATEGORY_COLS:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+    for col in DATE_COLS:
+        if col in df.columns:
+            df[col] = pd.to_datetime(df[col], format="%Y-%m-%d %H:%M:%S")
+    for col, dtype in NARROW_DTYPES.items():
+        if col in df.columns:
+            df[col] = df[col].astype(dtype)
+    return df
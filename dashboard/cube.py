@@ -0,0 +1,183 @@
+"""Pre-materialized aggregate cube for the Overview and Business Questions pages"""
+import numpy as np
+import pandas as pd
+
+import backend
+
+# Finest grain of the item cube
+DIMENSIONS = ["order_year", "order_month", "customer_state", "product_category_name_english",
+              "order_status", "is_delayed", "review_score"]
+
+# Dimensions that are fixed per order, so distinct orders add up across them
+ORDER_DIMENSIONS = ["order_year", "order_month", "customer_state", "order_status", "is_delayed"]
+
+CATEGORY_DIMENSIONS = ORDER_DIMENSIONS[:3] + ["product_category_name_english"] + ORDER_DIMENSIONS[3:]
+
+# Grain and row-count measure of each cube table
+TABLES = {
+    "items": (DIMENSIONS, "item_count"),
+    "orders": (ORDER_DIMENSIONS, "orders"),
+    "category_orders": (CATEGORY_DIMENSIONS, "orders"),
+}
+
+# Fact keys whose distinct values make up the global totals
+TOTAL_KEYS = {"orders": "order_key", "customers": "customer_key",
+              "products": "product_key", "sellers": "seller_key", "dates": "date_key"}
+
+SOURCE_COLS = DIMENSIONS + list(TOTAL_KEYS.values()) + ["price", "freight_value"]
+
+
+class Cube:
+    """Additive measures at the cube grain plus distinct-order tables.
+
+    ``items`` holds item counts, revenue, freight and review sums at the full
+    grain. Distinct counts do not add up across categories (an order can span
+    several), so ``orders`` keeps them at the order grain and
+    ``category_orders`` at the order grain plus category. ``key_counts`` holds
+    the fact rows per dimension key, from which the global distinct counts and
+    the purchase date range follow. Every table is additive, so a cube built
+    from a set of fact rows can be added to or subtracted from another.
+
+    An approximate cube (see report.approximate_cube) keeps only the
+    purchase-day counts; its distinct customers, products and sellers are
+    HyperLogLog sketches in ``distinct``, and its distinct orders add up
+    from ``orders``.
+    """
+
+    def __init__(self, items, orders, category_orders, key_counts, first_date, distinct=None):
+        self.items = items
+        self.orders = orders
+        self.category_orders = category_orders
+        self.key_counts = key_counts
+        # Calendar day of date_key 0
+        self.first_date = first_date
+        self.distinct = distinct or {}
+
+    @property
+    def approximate(self):
+        return bool(self.distinct)
+
+    @property
+    def totals(self):
+        if self.approximate:
+            # Every order is in one cell of the order grain
+            totals = {"orders": int(self.orders["orders"].sum())}
+            totals.update({name: hll.count() for name, hll in self.distinct.items()})
+        else:
+            totals = {name: int(np.count_nonzero(self.key_counts[name]))
+                      for name in ["orders", "customers", "products", "sellers"]}
+        days = np.flatnonzero(self.key_counts["dates"])
+        # An empty cube (e.g. a date window without orders) has no purchase days
+        totals["first_purchase"] = self.first_date + pd.Timedelta(days=int(days[0])) if len(days) else None
+        totals["last_purchase"] = self.first_date + pd.Timedelta(days=int(days[-1])) if len(days) else None
+        return totals
+
+    def rollup(self, table, by, where=None):
+        """Sum the measures of ``table`` grouped by ``by``.
+
+        ``where`` maps dimensions to a value or list of values to keep.
+        """
+        df = getattr(self, table)
+        for dim, value in (where or {}).items():
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            df = df[df[dim].isin(values)]
+        measures = [c for c in df.columns if c not in DIMENSIONS]
+        if not by:
+            return df[measures].sum().to_frame().T
+        return df.groupby(by, observed=True)[measures].sum().reset_index()
+
+    def combine(self, other, sign=1):
+        """This cube plus ``sign`` times ``other``, both on the same calendar.
+
+        Cells whose row count drops to zero are removed.
+        """
+        tables = {}
+        for name, (dims, count) in TABLES.items():
+            delta = getattr(other, name).copy()
+            measures = [c for c in delta.columns if c not in dims]
+            delta[measures] = delta[measures] * sign
+            merged = pd.concat([getattr(self, name), delta], ignore_index=True)
+            merged = merged.groupby(dims, observed=True, dropna=False)[measures].sum().reset_index()
+            tables[name] = merged[merged[count] != 0].reset_index(drop=True)
+
+        key_counts = {}
+        for name, counts in self.key_counts.items():
+            delta = other.key_counts[name]
+            size = max(len(counts), len(delta))
+            key_counts[name] = (np.pad(counts, (0, size - len(counts))) +
+                                sign * np.pad(delta, (0, size - len(delta))))
+        return Cube(key_counts=key_counts, first_date=self.first_date, **tables)
+
+
+def _month_number(timestamp):
+    timestamp = pd.Timestamp(timestamp)
+    return timestamp.year * 12 + timestamp.month - 1
+
+
+def month_slice(data_cube, start, end):
+    """The cells of ``data_cube`` in the months [start, end) (both first days
+    of a month), with those months' purchase-day counts as its only key counts"""
+    lo, hi = _month_number(start), _month_number(end)
+    tables = {}
+    for name in TABLES:
+        df = getattr(data_cube, name)
+        month = df["order_year"].to_numpy(dtype=np.int64) * 12 + df["order_month"].to_numpy(dtype=np.int64) - 1
+        tables[name] = df[(month >= lo) & (month < hi)].reset_index(drop=True)
+    days = data_cube.key_counts["dates"]
+    first, last = [min(max((pd.Timestamp(t) - data_cube.first_date).days, 0), len(days))
+                   for t in (start, end)]
+    dates = np.zeros_like(days)
+    dates[first:last] = days[first:last]
+    return Cube(key_counts={"dates": dates}, first_date=data_cube.first_date, **tables)
+
+
+def review_stats(df):
+    """Add review mean/std columns computed from the additive review sums"""
+    df = df.copy()
+    n = df["reviews"]
+    df["review_mean"] = df["review_sum"] / n
+    variance = (df["review_sq"] - df["review_sum"] ** 2 / n) / (n - 1)
+    df["review_std"] = np.sqrt(variance.clip(lower=0))
+    return df
+
+
+def build_cube(model, rows=None):
+    """Aggregate the fact table of a star-schema model into a Cube.
+
+    ``rows`` restricts the cube to those fact rows (see StarSchema.select).
+    Runs on the active compute backend (see backend.py).
+    """
+    run = backend.query("cube")
+    if run is not None:
+        return run(model, rows)
+    df = model.select(SOURCE_COLS, rows)
+    score = df["review_score"].astype("float64")
+    df["reviews"] = score.notna().astype("int64")
+    df["review_sum"] = score.fillna(0)
+    df["review_sq"] = score.fillna(0) ** 2
+
+    items = df.groupby(DIMENSIONS, observed=True, dropna=False).agg(
+        item_count=("price", "size"),
+        revenue=("price", "sum"),
+        freight=("freight_value", "sum"),
+        reviews=("reviews", "sum"),
+        review_sum=("review_sum", "sum"),
+        review_sq=("review_sq", "sum"),
+    ).reset_index()
+
+    orders = df.groupby(ORDER_DIMENSIONS, observed=True, dropna=False).agg(
+        orders=("order_key", "nunique"),
+    ).reset_index()
+
+    category_orders = df.groupby(CATEGORY_DIMENSIONS, observed=True, dropna=False).agg(
+        orders=("order_key", "nunique"),
+    ).reset_index()
+
+    return Cube(items, orders, category_orders, key_counts(model, df),
+                model["dates"]["order_date"].iloc[0])
+
+
+def key_counts(model, df):
+    """Rows per dimension key of ``df`` (a build_cube source), by TOTAL_KEYS name"""
+    return {name: np.bincount(df[key].to_numpy(), minlength=len(model[name]))
+            for name, key in TOTAL_KEYS.items()}
@@ -0,0 +1,199 @@
+"""Lazy, dependency-driven loading of the data behind each dashboard page.
+
+A Registry maps dataset names to a loader and the datasets it is built
+from. ``get`` loads a dataset's dependencies first, then the dataset
+itself, once; ``invalidate`` drops a dataset and everything built on it.
+
+The dashboard registry (dashboard_registry) sits on the snapshot: "model"
+only checks that the snapshot is fresh, applies pending drop files and
+opens it lazily (see ingest.read_snapshot), and every table and artifact is
+its own dataset read from disk on first use. Tables come from the host's
+shared memory-mapped copy (see shared.py), so server processes on the
+same host hold one copy between them. PAGE_DATASETS declares what
+each page reads, so opening a page loads exactly that and nothing else;
+the Conclusions page loads nothing.
+
+The first dashboard session starts a WarmUp that loads every page's
+datasets (WARM_UP_ORDER), then the default page results, in a background
+thread; pages show its progress instead of loading in the session's own
+run. DASHBOARD_WARM_UP=0 turns it off. A deploy can warm the disk side
+(snapshot, artifacts and shared copy) before the server starts:
+
+    python dashboard/datasets.py [data_path]
+"""
+import os
+import sys
+import threading
+import time
+
+import geo
+import incremental
+import report
+import shared
+import star
+import timing
+
+# Datasets each report page reads (beyond "model", which they all build on).
+# "dates" bounds the sidebar date filter; a date window other than the full
+# history reads the fact partitions it covers (see report.window_rows)
+# instead of the whole-history artifacts.
+PAGE_DATASETS = {
+    "overview": ["cube", "dates"],
+    "business_questions": ["cube", "dates"],
+    # The reference date defaults to the cube's last purchase
+    "rfm": ["rfm_stats", "customers", "cube", "dates"],
+    "geospatial": ["geo_states", "geo_source", "geo_index", "dates"],
+    "product_clustering": ["product_stats", "products", "dates"],
+    "cohorts": ["cohort_months", "dates"],
+    "delivery": ["sla_histograms", "dates"],
+    "conclusions": [],
+}
+
+# Datasets the warm-up loads, in order: the pages' own, first page first
+WARM_UP_ORDER = list(dict.fromkeys(
+    ["model"] + [name for names in PAGE_DATASETS.values() for name in names]))
+
+# Load the datasets in the background on server boot (override with DASHBOARD_WARM_UP)
+WARM_UP = os.environ.get("DASHBOARD_WARM_UP", "1") == "1"
+
+# Artifact datasets and the model artifact each one reads
+ARTIFACTS = {"rfm_stats": "rfm", "product_stats": "products", "cohort_months": "cohorts",
+             "sla_histograms": "sla", "geo_states": "geo_states", "geo_source": "geo_source"}
+
+
+class Registry:
+    """Named datasets loaded on first use, after the datasets they depend on"""
+
+    def __init__(self):
+        self._loaders = {}
+        self._deps = {}
+        self._values = {}
+        self._lock = threading.RLock()
+
+    def register(self, name, loader, deps=()):
+        """Declare dataset ``name``, built by ``loader(*values of deps)``"""
+        self._loaders[name] = loader
+        self._deps[name] = list(deps)
+        self.invalidate(name)
+
+    def deps(self, name):
+        return list(self._deps[name])
+
+    def get(self, name, _path=()):
+        """Dataset ``name``, loading it (and its dependencies) if needed"""
+        if name in self._values:
+            return self._values[name]
+        if name not in self._loaders:
+            raise KeyError(f"Unknown dataset {name!r}")
+        if name in _path:
+            raise ValueError(f"Dataset dependency cycle: {' -> '.join(_path + (name,))}")
+        with self._lock:
+            if name not in self._values:
+                args = [self.get(dep, _path + (name,)) for dep in self._deps[name]]
+                with timing.span(f"load {name}"):
+                    self._values[name] = self._loaders[name](*args)
+            return self._values[name]
+
+    def require(self, names):
+        """Load every dataset in ``names``; returns them by name"""
+        return {name: self.get(name) for name in names}
+
+    def loaded(self):
+        """Names of the datasets loaded so far"""
+        return list(self._values)
+
+    def invalidate(self, name):
+        """Drop ``name`` and every dataset depending on it, so they reload on next use"""
+        with self._lock:
+            self._values.pop(name, None)
+            for other, deps in self._deps.items():
+                if name in deps and other in self._values:
+                    self.invalidate(other)
+
+
+class WarmUp:
+    """Loads datasets of a registry, then runs extra tasks, in a daemon thread.
+
+    ``tasks`` are (name, function) pairs run after the datasets, e.g. page
+    results with default settings that fill a cache. A dataset or task that
+    raises is recorded in ``failed`` and the warm-up moves on; a page then
+    loads it itself and reports the error.
+    """
+
+    def __init__(self, registry, names=WARM_UP_ORDER, tasks=()):
+        self.registry = registry
+        self.names = list(names)
+        self.tasks = list(tasks)
+        self.failed = {}
+        self.seconds = {}
+        self.current = None
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="warm-up", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        steps = [(name, lambda name=name: self.registry.get(name)) for name in self.names]
+        try:
+            for name, run in steps + self.tasks:
+                self.current = name
+                start = time.perf_counter()
+                try:
+                    with timing.span(f"warm up {name}"):
+                        run()
+                except Exception as e:
+                    self.failed[name] = e
+                self.seconds[name] = time.perf_counter() - start
+        finally:
+            self.current = None
+            self._done.set()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def join(self):
+        self._done.wait()
+        return self
+
+    def progress(self):
+        """Fraction of the datasets and tasks finished"""
+        total = len(self.names) + len(self.tasks)
+        if self.done or not total:
+            return 1.0
+        steps = self.names + [name for name, _ in self.tasks]
+        return steps.index(self.current) / total if self.current in steps else 0.0
+
+    def ready(self, names):
+        """Whether every dataset in ``names`` is loaded (or failed to load),
+        so getting them will not wait on the warm-up"""
+        loaded = set(self.registry.loaded()) | set(self.failed)
+        return self.done or all(name in loaded for name in names)
+
+
+def dashboard_registry(data_path):
+    """The dashboard's datasets over the snapshot of ``data_path``"""
+    registry = Registry()
+    registry.register("model", lambda: shared.share(data_path, incremental.refresh(data_path)[0]))
+    for name in star.TABLES:
+        registry.register(name, lambda model, name=name: model[name], ["model"])
+    registry.register("cube", report.model_cube, ["model"])
+    for name, artifact in ARTIFACTS.items():
+        registry.register(name, lambda model, artifact=artifact: model.artifacts.get(artifact),
+                          ["model"])
+    registry.register("geo_index", lambda: geo.load_geo_index(data_path))
+    return registry
+
+
+if __name__ == "__main__":
+    import ingest
+
+    path = sys.argv[1] if len(sys.argv) > 1 else ingest.find_data_path()
+    if path is None:
+        sys.exit("orders_dataset.csv not found")
+    warm_up = WarmUp(dashboard_registry(path)).start().join()
+    for name, seconds in warm_up.seconds.items():
+        failed = f"  failed: {warm_up.failed[name]!r}" if name in warm_up.failed else ""
+        print(f"{name:<16}{seconds:8.3f}s{failed}")
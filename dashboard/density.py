@@ -0,0 +1,125 @@
+"""Server-side 2D binning for scatter plots too large to send point by point.
+
+Above POINT_LIMIT points the RFM and Product Clustering scatters are drawn
+as one marker per occupied cell of a BINS x BINS grid, sized and coloured by
+how many points fall in it, so the browser receives at most BINS**2 markers
+instead of every customer or product. Each point's cell is kept, so a
+selection of cells maps back to the underlying rows.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+# Scatters with more points than this are binned (override with DASHBOARD_SCATTER_LIMIT)
+POINT_LIMIT = int(os.environ.get("DASHBOARD_SCATTER_LIMIT", 20_000))
+
+# Grid resolution per axis
+BINS = 60
+
+RENDER_MODES = ["auto", "points", "webgl", "density"]
+
+
+def render_mode(n_points, mode="auto", limit=POINT_LIMIT):
+    """"points", "webgl" or "density" for a scatter of ``n_points``.
+
+    "auto" keeps the plain SVG scatter up to ``limit`` points and bins above it.
+    """
+    if mode not in RENDER_MODES:
+        raise ValueError(f"Unknown render mode {mode!r}; expected one of {RENDER_MODES}")
+    if mode != "auto":
+        return mode
+    return "density" if n_points > limit else "points"
+
+
+def _edges(values, bins):
+    finite = values[np.isfinite(values)]
+    lo, hi = (finite.min(), finite.max()) if len(finite) else (0.0, 1.0)
+    if lo == hi:
+        lo, hi = lo - 0.5, hi + 0.5
+    return np.linspace(lo, hi, bins + 1)
+
+
+def _bin_index(values, edges):
+    index = np.searchsorted(edges, values, side="right") - 1
+    return np.clip(index, 0, len(edges) - 2)
+
+
+def bin_points(df, x, y, by=None, bins=BINS):
+    """Count the rows of ``df`` on a ``bins`` x ``bins`` grid over columns ``x`` and ``y``.
+
+    Returns ``(cells, cell_of_row)``: one row per occupied cell with its
+    bounds, centre and point count (plus the most common ``by`` value and
+    its share when ``by`` is given), and each row's cell number, -1 for rows
+    with a missing coordinate.
+    """
+    xs = df[x].to_numpy(dtype="float64", na_value=np.nan)
+    ys = df[y].to_numpy(dtype="float64", na_value=np.nan)
+    x_edges, y_edges = _edges(xs, bins), _edges(ys, bins)
+    valid = np.isfinite(xs) & np.isfinite(ys)
+    cell_of_row = np.full(len(df), -1, dtype=np.int64)
+    cell_of_row[valid] = _bin_index(xs[valid], x_edges) * bins + _bin_index(ys[valid], y_edges)
+
+    counts = np.bincount(cell_of_row[valid], minlength=bins * bins)
+    occupied = np.flatnonzero(counts)
+    ix, iy = np.divmod(occupied, bins)
+    cells = pd.DataFrame({
+        "cell": occupied,
+        "x_lo": x_edges[ix], "x_hi": x_edges[ix + 1],
+        "y_lo": y_edges[iy], "y_hi": y_edges[iy + 1],
+        "count": counts[occupied],
+    })
+    cells[x] = (cells["x_lo"] + cells["x_hi"]) / 2
+    cells[y] = (cells["y_lo"] + cells["y_hi"]) / 2
+
+    if by is not None:
+        pairs = pd.DataFrame({"cell": cell_of_row[valid], by: df[by].to_numpy()[valid]})
+        top = (pairs.groupby(["cell", by], observed=True).size().rename("top_count")
+               .reset_index().sort_values("top_count", ascending=False)
+               .drop_duplicates("cell"))
+        cells = cells.merge(top, on="cell", how="left")
+        cells["top_share"] = cells["top_count"] / cells["count"]
+        cells = cells.drop(columns="top_count")
+    return cells, cell_of_row
+
+
+def density_figure(cells, x, y, by=None, labels=None):
+    """One WebGL marker per occupied cell, size and colour scaled by log point count"""
+    labels = labels or {}
+    log_count = np.log10(cells["count"].to_numpy())
+    size = 6 + 24 * log_count / max(log_count.max(), 1)
+    hover = (f"{labels.get(x, x)}: %{{customdata[1]:,.4g}} – %{{customdata[2]:,.4g}}<br>"
+             f"{labels.get(y, y)}: %{{customdata[3]:,.4g}} – %{{customdata[4]:,.4g}}<br>"
+             "Points: %{customdata[0]:,}")
+    customdata = cells[["count", "x_lo", "x_hi", "y_lo", "y_hi"]].to_numpy(dtype=object)
+    if by is not None:
+        hover += f"<br>Top {by}: %{{customdata[5]}} (%{{customdata[6]:.0%}})"
+        customdata = np.column_stack([customdata, cells[by].astype(str), cells["top_share"]])
+
+    fig = go.Figure(go.Scattergl(
+        x=cells[x], y=cells[y], mode="markers",
+        marker=dict(size=size, color=log_count, colorscale="Viridis", showscale=True,
+                    colorbar=dict(title="Points",
+                                  tickvals=np.arange(0, np.ceil(log_count.max()) + 1),
+                                  ticktext=[f"{10 ** t:,.0f}"
+                                            for t in np.arange(0, np.ceil(log_count.max()) + 1)])),
+        customdata=customdata, hovertemplate=hover + "<extra></extra>",
+    ))
+    fig.update_layout(xaxis_title=labels.get(x, x), yaxis_title=labels.get(y, y))
+    return fig
+
+
+def selected_cells(cells, event):
+    """Cell numbers of the markers selected in a density_figure chart event"""
+    if not event:
+        return []
+    indices = np.asarray(event.get("selection", {}).get("point_indices", []), dtype=np.int64)
+    # A selection made on an earlier grid may point past this one
+    indices = indices[indices < len(cells)]
+    return cells["cell"].to_numpy()[indices].tolist()
+
+
+def rows_in_cells(df, cell_of_row, cells):
+    """Rows of ``df`` that fall in any of ``cells``"""
+    return df[np.isin(cell_of_row, cells)]
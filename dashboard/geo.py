@@ -0,0 +1,212 @@
+"""Zip-prefix geolocation index for the Geospatial page"""
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+import backend
+import ingest
+import schema
+
+GEO_FILE = "geolocation_dataset.csv"
+INDEX_FILE = "geo_index.npz"
+INDEX_MANIFEST = "geo_index.json"
+INDEX_VERSION = 1
+
+# Fact columns state_totals reads
+FACT_COLUMNS = ["customer_key", "price", "review_score"]
+
+
+class GeoIndex:
+    """Sorted zip prefixes with their centroid and first city/state.
+
+    Lookups are a binary search over ``zips``; state and city are stored as
+    codes into ``states`` and ``cities``.
+    """
+
+    def __init__(self, zips, lat, lng, state_codes, city_codes, states, cities):
+        self.zips = zips
+        self.lat = lat
+        self.lng = lng
+        self.state_codes = state_codes
+        self.city_codes = city_codes
+        self.states = states
+        self.cities = cities
+
+    def __len__(self):
+        return len(self.zips)
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in vars(self).values())
+
+    @property
+    def digest(self):
+        """Content hash; derived per-state totals are only reused for the same index"""
+        digest = hashlib.sha1()
+        for name in ["zips", "lat", "lng", "state_codes"]:
+            digest.update(np.ascontiguousarray(getattr(self, name)).tobytes())
+        digest.update("|".join(self.states).encode())
+        return digest.hexdigest()[:16]
+
+    def positions(self, zip_prefixes):
+        """Index position of each zip prefix, -1 where it is unknown"""
+        zip_prefixes = np.asarray(zip_prefixes, dtype=np.int64)
+        pos = np.searchsorted(self.zips, zip_prefixes)
+        pos = np.minimum(pos, len(self.zips) - 1)
+        return np.where(self.zips[pos] == zip_prefixes, pos, -1)
+
+    def lookup(self, zip_prefixes):
+        """Centroid, state and city per zip prefix (NaN where unknown)"""
+        pos = self.positions(zip_prefixes)
+        found = pos >= 0
+        safe = np.where(found, pos, 0)
+        return pd.DataFrame({
+            "geolocation_lat": np.where(found, self.lat[safe], np.nan),
+            "geolocation_lng": np.where(found, self.lng[safe], np.nan),
+            "geolocation_state": pd.Categorical.from_codes(
+                np.where(found, self.state_codes[safe], -1), categories=self.states),
+            "geolocation_city": pd.Categorical.from_codes(
+                np.where(found, self.city_codes[safe], -1), categories=self.cities),
+        })
+
+    def save(self, path):
+        np.savez(path, **vars(self))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(**{name: data[name] for name in data.files})
+
+
+def build_geo_index(csv_path):
+    """Aggregate the raw geolocation rows into a GeoIndex"""
+    geolocation_df = schema.read_csv(csv_path, "geolocation")
+    agg = geolocation_df.groupby("geolocation_zip_code_prefix").agg({
+        "geolocation_lat": "mean",
+        "geolocation_lng": "mean",
+        "geolocation_city": "first",
+        "geolocation_state": "first"
+    })
+    states = pd.Categorical(agg["geolocation_state"])
+    cities = pd.Categorical(agg["geolocation_city"])
+    return GeoIndex(
+        zips=agg.index.to_numpy(dtype=np.int32),
+        lat=agg["geolocation_lat"].to_numpy(dtype=np.float32),
+        lng=agg["geolocation_lng"].to_numpy(dtype=np.float32),
+        state_codes=states.codes.astype(np.int8),
+        city_codes=cities.codes.astype(np.int32),
+        states=np.asarray(states.categories, dtype=str),
+        cities=np.asarray(cities.categories, dtype=str),
+    )
+
+
+def load_geo_index(data_path):
+    """Load the persisted index, rebuilding it when the geolocation CSV changed.
+
+    Falls back to a persisted index when the CSV itself is absent, and raises
+    FileNotFoundError when neither exists.
+    """
+    csv_path = os.path.join(data_path, GEO_FILE)
+    cache = ingest.cache_dir(data_path)
+    index_path = os.path.join(cache, INDEX_FILE)
+    manifest_path = os.path.join(cache, INDEX_MANIFEST)
+
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = None
+    if manifest and manifest.get("version") != INDEX_VERSION:
+        manifest = None
+
+    if not os.path.exists(csv_path):
+        if manifest and os.path.exists(index_path):
+            return GeoIndex.load(index_path)
+        raise FileNotFoundError(csv_path)
+
+    source = ingest.file_fingerprint(csv_path, manifest and manifest["source"])
+    if manifest and manifest["source"]["sha1"] == source["sha1"] and os.path.exists(index_path):
+        return GeoIndex.load(index_path)
+
+    index = build_geo_index(csv_path)
+    try:
+        os.makedirs(cache, exist_ok=True)
+        index.save(index_path)
+        with open(manifest_path, "w") as f:
+            json.dump({"version": INDEX_VERSION, "source": source}, f, indent=2)
+    except OSError:
+        pass
+    return index
+
+
+def state_totals(model, index, rows=None):
+    """Additive per-state sums behind state_summary(), one row per index state.
+
+    Each customer's zip prefix is resolved through the index; fact rows reach
+    their state through the customer key and the sums are bincounts.
+    ``rows`` restricts the fact rows, so a delta can be added or subtracted.
+    Runs on the active compute backend (see backend.py).
+    """
+    run = backend.query("state_totals")
+    if run is not None:
+        return run(model, index, rows)
+    fact = model.fact if rows is None else model.fact.iloc[rows]
+    customer_key = fact["customer_key"].to_numpy()
+    zips = model["customers"]["customer_zip_code_prefix"].to_numpy()
+    pos = index.positions(zips[customer_key])
+    found = pos >= 0
+    found[found] = index.state_codes[pos[found]] >= 0
+    pos = pos[found]
+    state = index.state_codes[pos].astype(np.int64)
+    n_states = len(index.states)
+
+    price = fact["price"].to_numpy()[found]
+    review = fact["review_score"].to_numpy(dtype="float64", na_value=np.nan)[found]
+    has_review = ~np.isnan(review)
+    return pd.DataFrame({
+        "orders": np.bincount(state, minlength=n_states),
+        "revenue": np.bincount(state, weights=price, minlength=n_states),
+        "reviews": np.bincount(state[has_review], minlength=n_states),
+        "review_sum": np.bincount(state[has_review], weights=review[has_review], minlength=n_states),
+        "lat_sum": np.bincount(state, weights=index.lat[pos], minlength=n_states),
+        "lng_sum": np.bincount(state, weights=index.lng[pos], minlength=n_states),
+    }, index=pd.Index(index.states, name="State"))
+
+
+def state_summary(model, index, rows=None):
+    """Orders, revenue, review and centroid per customer state from the index.
+
+    Uses the model's "geo_states" artifact when it was built from this index
+    and ``rows`` (a restriction of the fact rows) is not given.
+    """
+    totals = model.artifacts.get("geo_states") if rows is None else None
+    if totals is None or model.artifacts.get("geo_source") != index.digest:
+        totals = state_totals(model, index, rows)
+    orders = totals["orders"]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        summary = pd.DataFrame({
+            "State": totals.index,
+            "Total_Orders": orders.to_numpy(),
+            "Total_Revenue": totals["revenue"].to_numpy(),
+            "Avg_Review": (totals["review_sum"] / totals["reviews"]).to_numpy(),
+            "geolocation_lat": (totals["lat_sum"] / orders).to_numpy(),
+            "geolocation_lng": (totals["lng_sum"] / orders).to_numpy(),
+        })
+    summary = summary[summary["Total_Orders"] > 0]
+    return summary.sort_values("Total_Orders", ascending=False).reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    path = sys.argv[1] if len(sys.argv) > 1 else ingest.find_data_path()
+    if path is None:
+        sys.exit("orders_dataset.csv not found")
+    start = time.perf_counter()
+    index = load_geo_index(path)
+    print(f"{len(index):,} zip prefixes, {index.nbytes / 1e6:.2f} MB, "
+          f"loaded in {time.perf_counter() - start:.2f}s")
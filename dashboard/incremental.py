@@ -0,0 +1,419 @@
+"""Incremental ingest of daily order, item, review and customer drops.
+
+Drop files land in ``<data>/incoming`` and are named after the table they
+extend, e.g. ``orders_2018-09-04.csv`` or ``order_reviews_2018-09-04.csv``
+(see DROP_TABLES). A refresh applies only the files that are new or whose
+content changed since they were applied. Rows are upserted on their natural
+ID: an order, an order's item set or a review that appears in a drop
+replaces the stored one. Orders purchased after the watermark are new by
+definition; older ones are only applied when unknown or changed.
+
+Every order a drop touches has its fact rows rebuilt. The cube, product,
+delivery SLA and geo artifacts are patched by subtracting the replaced rows and adding
+the new ones, and the RFM and cohort inputs are recomputed for the
+customers those rows belong to, so a refresh costs time in proportion to
+the drop, not the history.
+"""
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+import cohort
+import compact
+import cube
+import geo
+import ingest
+import products
+import rfm
+import schema
+import sla
+import star
+import stream
+import timing
+
+DROP_DIR = "incoming"
+
+# Set to 1 to build the model out of core (see stream.py)
+STREAMING_ENV = "DASHBOARD_STREAMING"
+
+# Drop file prefix -> table it feeds
+DROP_TABLES = {
+    "orders": "orders",
+    "order_items": "order_items",
+    "order_reviews": "reviews",
+    "customers": "customers",
+}
+
+# Stored order columns compared for orders at or below the watermark
+ORDER_CHANGE_COLS = ["customer_key", "order_status", "order_purchase_timestamp",
+                     "order_approved_at", "order_delivered_carrier_date",
+                     "order_delivered_customer_date", "order_estimated_delivery_date"]
+
+
+def drop_table(filename):
+    """Table a drop file feeds, or None for files that are not drops"""
+    if not filename.endswith(".csv"):
+        return None
+    for prefix in sorted(DROP_TABLES, key=len, reverse=True):
+        if filename.startswith(prefix + "_"):
+            return DROP_TABLES[prefix]
+    return None
+
+
+def pending_drops(data_path, applied):
+    """(filename, table, fingerprint) of drop files not applied in their current form"""
+    folder = os.path.join(data_path, DROP_DIR)
+    if not os.path.isdir(folder):
+        return []
+    pending = []
+    for filename in sorted(os.listdir(folder)):
+        table = drop_table(filename)
+        if table is None:
+            continue
+        entry = ingest.file_fingerprint(os.path.join(folder, filename), applied.get(filename))
+        if applied.get(filename, {}).get("sha1") != entry["sha1"]:
+            pending.append((filename, table, entry))
+    return pending
+
+
+def read_drops(data_path, pending):
+    """Raw rows of the pending drop files, concatenated per table in file order"""
+    frames = {}
+    for filename, table, _ in pending:
+        frames.setdefault(table, []).append(
+            schema.read_csv(os.path.join(data_path, DROP_DIR, filename), table))
+    return {table: pd.concat(parts, ignore_index=True) for table, parts in frames.items()}
+
+
+def _changed(rows, stored):
+    """Mask of ``rows`` that differ from their ``stored`` version"""
+    changed = np.zeros(len(rows), dtype=bool)
+    for col in ORDER_CHANGE_COLS:
+        new = pd.Series(np.asarray(rows[col], dtype=object))
+        old = pd.Series(np.asarray(stored[col], dtype=object))
+        changed |= ~((new == old) | (new.isna() & old.isna())).to_numpy()
+    return changed
+
+
+def apply_delta(model, tables, watermark=None):
+    """Upsert one batch of raw drop rows into ``model``.
+
+    ``tables`` maps "orders", "order_items", "reviews" and "customers" to raw
+    rows; any may be missing. Returns the updated model and a change record
+    with the positions of the replaced fact rows in ``model``, the number of
+    new rows appended to the updated fact, the calendar shift and the new
+    watermark; the change is None when the batch touched nothing.
+    """
+    orders, customers, sellers = model["orders"], model["customers"], model["sellers"]
+    dates, fact, reviews = model["dates"], model.fact, model.reviews
+    touched = []
+    shift = new_orders = updated_orders = 0
+
+    if "customers" in tables:
+        customers, keys = star.upsert_dimension(
+            customers, "customer_id", compact.compact_frame(tables["customers"]))
+        # Orders of customers whose attributes changed move between cube cells
+        existing = np.zeros(len(customers), dtype=bool)
+        existing[keys[keys < len(model["customers"])]] = True
+        order_customer = orders["customer_key"].to_numpy()
+        touched.append(np.flatnonzero((order_customer >= 0) & existing[order_customer]))
+    customer_codec = compact.IdCodec.from_unique(customers["customer_id"])
+
+    if "orders" in tables:
+        rows = compact.compact_frame(ingest.prepare_orders(tables["orders"]))
+        rows = rows.drop_duplicates(subset="order_id", keep="last").reset_index(drop=True)
+        rows["customer_key"] = customer_codec.encode(rows["customer_id"])
+        keys = compact.IdCodec.from_unique(orders["order_id"]).encode(rows["order_id"])
+
+        # Known orders at or below the watermark are only applied when changed
+        recheck = keys >= 0
+        if watermark is not None:
+            recheck &= (rows["order_purchase_timestamp"] <= watermark).to_numpy()
+        keep = np.ones(len(rows), dtype=bool)
+        recheck = np.flatnonzero(recheck)
+        keep[recheck] = _changed(rows.iloc[recheck], orders.iloc[keys[recheck]])
+        rows = rows[keep].reset_index(drop=True)
+
+        if len(rows):
+            dates, rows["date_key"], shift = star.build_dates(rows["order_purchase_timestamp"], dates)
+            if shift:
+                orders = orders.assign(date_key=orders["date_key"] + shift)
+                fact = fact.assign(date_key=fact["date_key"] + shift)
+            orders, keys = star.upsert_dimension(orders, "order_id", rows[star.ORDER_COLUMNS])
+            touched.append(keys)
+            new_orders = int((keys >= len(model["orders"])).sum())
+            updated_orders = len(keys) - new_orders
+            latest = rows["order_purchase_timestamp"].max()
+            watermark = latest if watermark is None else max(watermark, latest)
+    order_codec = compact.IdCodec.from_unique(orders["order_id"])
+
+    items = None
+    if "order_items" in tables:
+        raw = tables["order_items"]
+        unknown = raw.loc[~raw["seller_id"].isin(sellers["seller_id"]), "seller_id"]
+        if len(unknown):
+            sellers, _ = star.upsert_dimension(
+                sellers, "seller_id", pd.DataFrame({"seller_id": unknown.unique()}))
+        product_codec = compact.IdCodec.from_unique(model["products"]["product_id"])
+        seller_codec = compact.IdCodec.from_unique(sellers["seller_id"])
+        items = star.encode_items(raw, order_codec, product_codec, seller_codec)
+        items = items[items["order_key"] >= 0]
+        items = items.drop_duplicates(subset=["order_key", "order_item_id"], keep="last")
+        touched.append(items["order_key"].to_numpy())
+
+    if "reviews" in tables:
+        rows = star.encode_reviews(tables["reviews"], order_codec)
+        rows = rows.drop_duplicates(subset="review_id", keep="last")
+        reviews = star.append_rows(reviews[~reviews["review_id"].isin(rows["review_id"])], rows)
+        touched.append(rows["order_key"].to_numpy())
+
+    touched = np.concatenate(touched) if touched else np.array([], dtype=np.int32)
+    if not len(touched):
+        return model, None
+
+    # Rebuild the fact rows of every touched order from its stored items,
+    # replaced wholesale by the drop's items where it has any
+    affected = np.zeros(len(orders), dtype=bool)
+    affected[touched] = True
+    hit = affected[fact["order_key"].to_numpy()]
+    stored = fact.loc[hit, star.ITEM_COLUMNS].drop_duplicates(subset=["order_key", "order_item_id"])
+    if items is not None:
+        replaced = np.zeros(len(orders), dtype=bool)
+        replaced[items["order_key"].to_numpy()] = True
+        stored = pd.concat([stored[~replaced[stored["order_key"].to_numpy()]], items],
+                           ignore_index=True)
+    added = star.assemble_fact(orders, stored, reviews[affected[reviews["order_key"].to_numpy()]])
+
+    fact, added_rows = star.merge_sorted(fact[~hit].reset_index(drop=True), added)
+    updated = star.StarSchema(
+        fact=fact,
+        orders=orders,
+        customers=customers,
+        products=model["products"],
+        sellers=sellers,
+        dates=dates,
+        reviews=reviews,
+    )
+    updated.artifacts = model.artifacts
+    updated.increments = model.increments
+    change = {
+        "removed": np.flatnonzero(hit),
+        "added": added_rows,
+        "shift": shift,
+        "watermark": watermark,
+        "new_orders": new_orders,
+        "updated_orders": updated_orders,
+    }
+    return updated, change
+
+
+def build_artifacts(model, index=None):
+    """Derived aggregates stored with the snapshot: cube, RFM and cohort
+    inputs, product totals, delay histograms and geo totals"""
+    artifacts = {"cube": cube.build_cube(model), "rfm": rfm.customer_stats(model),
+                 "cohorts": cohort.customer_months(model),
+                 "products": products.product_stats(model),
+                 "sla": sla.build_histograms(model)}
+    if index is not None:
+        artifacts["geo_states"] = geo.state_totals(model, index)
+        artifacts["geo_source"] = index.digest
+    return artifacts
+
+
+def patch_artifacts(old, new, change, index=None):
+    """Artifacts of ``new`` from those of ``old`` and the fact rows that changed"""
+    # A lazily read artifact is None when its file was unreadable
+    artifacts = {name: value for name, value in old.artifacts.items() if value is not None}
+    removed = change["removed"]
+    added = change["added"]
+
+    # A backfill before the first day re-keys the calendar; rebuild then
+    if change["shift"] or "cube" not in artifacts:
+        artifacts["cube"] = cube.build_cube(new)
+    else:
+        data_cube = artifacts["cube"]
+        if len(removed):
+            data_cube = data_cube.combine(cube.build_cube(old, removed), sign=-1)
+        if len(added):
+            data_cube = data_cube.combine(cube.build_cube(new, added))
+        artifacts["cube"] = data_cube
+
+    # Unique-customer keys are stable across drops (see rfm.unique_customers)
+    customers = np.unique(np.concatenate([
+        rfm.unique_customers(old)[0][old.fact["customer_key"].to_numpy()[removed]],
+        rfm.unique_customers(new)[0][new.fact["customer_key"].to_numpy()[added]]]))
+    customers = customers[customers >= 0]
+    if "rfm" in artifacts:
+        stats = artifacts["rfm"].drop(customers, errors="ignore")
+        artifacts["rfm"] = pd.concat([stats, rfm.customer_stats(new, customers)]).sort_index()
+    else:
+        artifacts["rfm"] = rfm.customer_stats(new)
+
+    if "cohorts" in artifacts:
+        artifacts["cohorts"] = cohort.patch_months(artifacts["cohorts"], new, customers)
+    else:
+        artifacts["cohorts"] = cohort.customer_months(new)
+
+    if "products" in artifacts:
+        artifacts["products"] = products.combine(
+            products.combine(artifacts["products"], products.product_stats(old, removed), sign=-1),
+            products.product_stats(new, added))
+    else:
+        artifacts["products"] = products.product_stats(new)
+
+    if "sla" in artifacts:
+        artifacts["sla"] = (artifacts["sla"].combine(sla.build_histograms(old, removed), sign=-1)
+                            .combine(sla.build_histograms(new, added)))
+    else:
+        artifacts["sla"] = sla.build_histograms(new)
+
+    if index is not None:
+        if "geo_states" in artifacts and artifacts.get("geo_source") == index.digest:
+            artifacts["geo_states"] = (artifacts["geo_states"]
+                                       - geo.state_totals(old, index, removed)
+                                       + geo.state_totals(new, index, added))
+        else:
+            artifacts["geo_states"] = geo.state_totals(new, index)
+        artifacts["geo_source"] = index.digest
+    return artifacts
+
+
+def merge_artifacts(artifacts, other):
+    """Artifacts of two disjoint sets of fact rows over the same dimensions, folded"""
+    merged = {
+        "cube": artifacts["cube"].combine(other["cube"]),
+        "rfm": rfm.merge_stats(artifacts["rfm"], other["rfm"]),
+        "cohorts": cohort.merge_months(artifacts["cohorts"], other["cohorts"]),
+        "products": products.combine(artifacts["products"], other["products"]),
+        "sla": artifacts["sla"].combine(other["sla"]),
+    }
+    if "geo_states" in artifacts:
+        merged["geo_states"] = artifacts["geo_states"] + other["geo_states"]
+        merged["geo_source"] = artifacts["geo_source"]
+    return merged
+
+
+def build_streaming(data_path, index=None, chunk_rows=stream.CHUNK_ROWS):
+    """Model whose artifacts are folded chunk by chunk from the streamed CSVs.
+
+    The returned model has every dimension but an empty fact table, so the
+    pages run off its artifacts. Drop files are not applied to such a model,
+    since patching needs the fact rows an update replaces.
+    """
+    artifacts = None
+    for chunk in stream.fact_chunks(data_path, chunk_rows):
+        with timing.span("fold chunk"):
+            part = build_artifacts(chunk, index)
+            artifacts = part if artifacts is None else merge_artifacts(artifacts, part)
+    model = star.StarSchema(fact=chunk.fact.iloc[:0], reviews=chunk.reviews, **chunk.dimensions)
+    model.artifacts = artifacts
+    return model
+
+
+def apply_drops(model, data_path, pending, index=None):
+    """Apply the ``pending`` drop files to ``model``; returns it and a summary"""
+    start = time.perf_counter()
+    increments = model.increments
+    watermark = increments["watermark"] and pd.Timestamp(increments["watermark"])
+    updated, change = apply_delta(model, read_drops(data_path, pending), watermark or None)
+    summary = {"files": [filename for filename, _, _ in pending],
+               "new_orders": 0, "updated_orders": 0, "rows_removed": 0, "rows_added": 0}
+    if change is not None:
+        updated.artifacts = patch_artifacts(model, updated, change, index)
+        watermark = change["watermark"]
+        summary.update(new_orders=change["new_orders"], updated_orders=change["updated_orders"],
+                       rows_removed=len(change["removed"]), rows_added=len(change["added"]))
+
+    files = dict(increments["files"])
+    files.update({filename: entry for filename, _, entry in pending})
+    updated.increments = {"watermark": watermark.isoformat() if watermark else None, "files": files}
+    summary["watermark"] = updated.increments["watermark"]
+    summary["seconds"] = round(time.perf_counter() - start, 3)
+    return updated, summary
+
+
+def _geo_index(data_path):
+    try:
+        return geo.load_geo_index(data_path)
+    except FileNotFoundError:
+        return None
+
+
+def refresh(data_path, use_snapshot=True, streaming=None):
+    """Load the dataset and apply any new drop files, keeping the snapshot current.
+
+    A full rebuild (first run or changed source CSVs) builds the artifacts
+    and replays every drop file. Returns the model and the summary of the
+    drops applied by this call, or None when there were none.
+
+    With ``streaming`` (default: the DASHBOARD_STREAMING environment
+    variable) the model is built out of core by build_streaming and drop
+    files are left unapplied.
+
+    A fresh snapshot is opened lazily: its tables and artifacts are read
+    when first used, and the geolocation index is only loaded to build or
+    patch artifacts.
+    """
+    if streaming is None:
+        streaming = os.environ.get(STREAMING_ENV) == "1"
+    summary = None
+    loaded = {}
+
+    def index():
+        # Only builds and drops need the geolocation index
+        if "index" not in loaded:
+            with timing.span("geo index"):
+                loaded["index"] = _geo_index(data_path)
+        return loaded["index"]
+
+    def prepare(model):
+        nonlocal summary
+        if not streaming:
+            model.artifacts = build_artifacts(model, index())
+        latest = model["orders"]["order_purchase_timestamp"].max()
+        model.increments = {"watermark": None if pd.isna(latest) else latest.isoformat(), "files": {}}
+        pending = pending_drops(data_path, {})
+        if pending and not streaming:
+            model, summary = apply_drops(model, data_path, pending, index())
+        return model
+
+    if streaming:
+        model, _ = ingest.load_dataset(data_path, use_snapshot, prepare, mode="streaming",
+                                       build=lambda path: build_streaming(path, index()),
+                                       lazy=True)
+        return model, None
+
+    model, _ = ingest.load_dataset(data_path, use_snapshot, prepare, lazy=True)
+    if not model.artifacts:
+        # Snapshot written without artifacts (or unreadable ones)
+        model.artifacts = build_artifacts(model, index())
+    pending = pending_drops(data_path, model.increments["files"])
+    if pending:
+        with timing.span("apply drops"):
+            model, summary = apply_drops(model, data_path, pending, index())
+        try:
+            ingest.save_dataset(data_path, model)
+        except OSError:
+            pass
+    return model, summary
+
+
+if __name__ == "__main__":
+    import sys
+
+    # Daily job: python dashboard/incremental.py [data_path]
+    path = sys.argv[1] if len(sys.argv) > 1 else ingest.find_data_path()
+    if path is None:
+        sys.exit("orders_dataset.csv not found")
+    start = time.perf_counter()
+    model, summary = refresh(path)
+    if summary is None:
+        print(f"no new drops; {len(model.fact):,} fact rows, watermark {model.increments['watermark']}")
+    else:
+        print(f"applied {len(summary['files'])} drop file(s) in {summary['seconds']:.2f}s: "
+              f"{summary['new_orders']:,} new / {summary['updated_orders']:,} updated orders, "
+              f"-{summary['rows_removed']:,} +{summary['rows_added']:,} fact rows, "
+              f"watermark {summary['watermark']}")
+    print(f"total {time.perf_counter() - start:.2f}s")
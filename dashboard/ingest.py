@@ -0,0 +1,444 @@
+"""Data loading for the dashboard: CSV parsing, frame building and the snapshot cache"""
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import threading
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import schema
+import sketch
+import star
+import timing
+
+try:
+    import pyarrow  # noqa: F401
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+# Source tables used to build the dashboard frames
+DATA_FILES = {
+    "orders": "orders_dataset.csv",
+    "order_items": "order_items_dataset.csv",
+    "products": "products_dataset.csv",
+    "customers": "customers_dataset.csv",
+    "reviews": "order_reviews_dataset.csv",
+    "category": "product_category_name_translation.csv",
+    "sellers": "sellers_dataset.csv",
+}
+
+DATETIME_COLS = ["order_purchase_timestamp", "order_approved_at",
+                 "order_delivered_customer_date", "order_estimated_delivery_date"]
+
+# Snapshot cache lives next to the CSVs
+SNAPSHOT_DIR = ".cache"
+SNAPSHOT_VERSION = 13
+
+# Directory of a fact partition with no purchase time (Hive's name for null)
+NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+
+# Fact keys whose distinct counts are sketched per partition (see sketch.py)
+SKETCH_KEYS = {"customers": "customer_key", "products": "product_key", "sellers": "seller_key"}
+
+POSSIBLE_PATHS = [
+    "data/",
+    "./data/",
+    "../data/",
+    "./",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data"),
+]
+
+
+def find_data_path(possible_paths=POSSIBLE_PATHS):
+    """Return the first folder that contains orders_dataset.csv, or None"""
+    for path in possible_paths:
+        if os.path.exists(os.path.join(path, DATA_FILES["orders"])):
+            return path
+    return None
+
+
+def read_tables(data_path):
+    """Read the raw Olist CSVs into a dict of DataFrames (concurrently, see schema.py)"""
+    return schema.read_tables(data_path, DATA_FILES)
+
+
+def prepare_orders(orders):
+    """Parse order timestamps and add the delivery features"""
+    orders = orders.copy()
+
+    # Convert datetime (a no-op for columns read with the schema)
+    for col in DATETIME_COLS:
+        orders[col] = pd.to_datetime(orders[col], format=schema.DATETIME_FORMAT)
+
+    # Create delivery features
+    orders["delivery_time"] = (orders["order_delivered_customer_date"] -
+                               orders["order_purchase_timestamp"]).dt.days
+    orders["estimated_time"] = (orders["order_estimated_delivery_date"] -
+                                orders["order_purchase_timestamp"]).dt.days
+    orders["is_delayed"] = orders["delivery_time"] > orders["estimated_time"]
+    return orders
+
+
+def prepare_products(products, category):
+    """Merge products with category"""
+    return products.merge(category, on="product_category_name", how="left")
+
+
+def build_model(tables):
+    """Build the star-schema model from the raw tables"""
+    return star.build_star(
+        orders=prepare_orders(tables["orders"]),
+        order_items=tables["order_items"],
+        products=prepare_products(tables["products"], tables["category"]),
+        customers=tables["customers"],
+        sellers=tables["sellers"],
+        reviews=tables["reviews"],
+    )
+
+
+def build_dataset(data_path):
+    """Read the source CSVs and build the star-schema model"""
+    return build_model(read_tables(data_path))
+
+
+def _file_hash(path, chunk_size=1 << 20):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_fingerprint(path, old=None):
+    """Size, mtime and content hash of one file; the hash is reused from
+    ``old`` when size and mtime are unchanged"""
+    stat = os.stat(path)
+    entry = {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+    if old and old["size"] == entry["size"] and old["mtime"] == entry["mtime"]:
+        entry["sha1"] = old["sha1"]
+    else:
+        entry["sha1"] = _file_hash(path)
+    return entry
+
+
+def fingerprint(data_path, previous=None):
+    """Fingerprint every source CSV by size, mtime and content hash.
+
+    Files whose size and mtime match ``previous`` reuse its hash, so an
+    unchanged tree is checked with a stat() per file instead of a full read.
+    """
+    previous = previous or {}
+    return {name: file_fingerprint(os.path.join(data_path, filename), previous.get(name))
+            for name, filename in DATA_FILES.items()}
+
+
+def _same_content(a, b):
+    return (a.keys() == b.keys() and
+            all(a[k]["size"] == b[k]["size"] and a[k]["sha1"] == b[k]["sha1"] for k in a))
+
+
+def dataset_key(sources, files=None):
+    """Short stable identifier for a set of source fingerprints.
+
+    ``files`` are the incremental drop files applied on top of the sources;
+    the review policy is part of the key since it changes the fact table.
+    """
+    content = star.REVIEW_POLICY + json.dumps({name: entry["sha1"] for name, entry in sources.items()},
+                                              sort_keys=True)
+    if files:
+        content += json.dumps({name: entry["sha1"] for name, entry in files.items()}, sort_keys=True)
+    return hashlib.sha1(content.encode()).hexdigest()[:16]
+
+
+def cache_dir(data_path):
+    return os.path.join(data_path, SNAPSHOT_DIR)
+
+
+def snapshot_dir(data_path):
+    return os.path.join(cache_dir(data_path), "snapshot")
+
+
+def _read_manifest(path):
+    try:
+        with open(os.path.join(path, "manifest.json")) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("version") != SNAPSHOT_VERSION:
+        return None
+    return manifest
+
+
+def _write_manifest(path, manifest):
+    with open(os.path.join(path, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+
+class LazyMapping(Mapping):
+    """Read-only mapping over known ``keys`` whose values are loaded by
+    ``load(key)`` on first access and kept"""
+
+    def __init__(self, keys, load):
+        self._keys = list(keys)
+        self._load = load
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, key):
+        if key not in self._values:
+            if key not in self._keys:
+                raise KeyError(key)
+            with self._lock:
+                if key not in self._values:
+                    self._values[key] = self._load(key)
+        return self._values[key]
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def loaded(self):
+        """Keys whose values have been loaded so far"""
+        return list(self._values)
+
+
+def _partition_path(month):
+    if month is None:
+        return os.path.join("fact", f"order_year={NULL_PARTITION}", "part-0.parquet")
+    year, month = month.split("-")
+    return os.path.join("fact", f"order_year={year}", f"order_month={month}", "part-0.parquet")
+
+
+def write_partitions(path, fact):
+    """Write the fact table as one Parquet file per purchase year/month.
+
+    The fact table is in purchase-time order (rows without a purchase time
+    first), so each month is one contiguous slice. Returns the partition
+    index: each file's month ("YYYY-MM", None for no purchase time), row
+    count and the file of its HyperLogLog sketches of SKETCH_KEYS. An empty
+    fact table is kept as one empty partition so its schema survives.
+    """
+    stamps = fact["order_purchase_timestamp"].to_numpy()
+    n_null = int(np.isnat(stamps).sum())
+    months, starts = np.unique(stamps[n_null:].astype("datetime64[M]"), return_index=True)
+    bounds = [(None, 0, n_null)] if n_null or not len(fact) else []
+    ends = list(starts[1:] + n_null) + [len(fact)]
+    bounds += [(str(month), int(start) + n_null, int(end))
+               for month, start, end in zip(months, starts, ends)]
+    partitions = []
+    for month, start, end in bounds:
+        file = _partition_path(month)
+        os.makedirs(os.path.dirname(os.path.join(path, file)), exist_ok=True)
+        part = fact.iloc[start:end]
+        part.to_parquet(os.path.join(path, file), index=False)
+        sketches = os.path.join(os.path.dirname(file), "sketches.npz")
+        np.savez(os.path.join(path, sketches),
+                 **{name: sketch.HyperLogLog.of(part[key].to_numpy()).registers
+                    for name, key in SKETCH_KEYS.items()})
+        partitions.append({"file": file, "month": month, "rows": end - start, "sketches": sketches})
+    return partitions
+
+
+def write_snapshot(data_path, model, sources, mode="memory"):
+    """Persist the model tables as Parquet (the fact table partitioned by
+    purchase year/month) and each artifact as a pickle, replacing any older
+    snapshot"""
+    target = snapshot_dir(data_path)
+    tmp = target + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(os.path.join(tmp, "artifacts"))
+    columns = {}
+    for name, df in model.tables.items():
+        if name == "fact":
+            partitions = write_partitions(tmp, df)
+        else:
+            df.to_parquet(os.path.join(tmp, f"{name}.parquet"), index=False)
+        columns[name] = list(df.columns)
+    # One file per artifact so a page reads only the ones it uses
+    for name, artifact in model.artifacts.items():
+        with open(os.path.join(tmp, "artifacts", f"{name}.pkl"), "wb") as f:
+            pickle.dump(artifact, f, protocol=pickle.HIGHEST_PROTOCOL)
+    # Manifest is written last so a half-written snapshot is never picked up
+    _write_manifest(tmp, {"version": SNAPSHOT_VERSION, "mode": mode,
+                          "review_policy": star.REVIEW_POLICY, "sources": sources,
+                          "increments": model.increments, "columns": columns,
+                          "partitions": partitions, "artifacts": list(model.artifacts)})
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(tmp, target)
+
+
+def _read_table(path, name):
+    with timing.span(f"read {name}"):
+        return pd.read_parquet(os.path.join(path, f"{name}.parquet"))
+
+
+def _overlaps(month, start, end):
+    """Whether purchases of ``month`` ("YYYY-MM", None for no purchase time)
+    can fall in [start, end); rows without a purchase time sort first, so
+    only windows open at the start include them"""
+    if month is None:
+        return start is None
+    first = np.datetime64(month, "M")
+    return ((start is None or first + 1 > np.datetime64(pd.Timestamp(start), "M"))
+            and (end is None or first.astype("datetime64[us]") < pd.Timestamp(end).to_datetime64()))
+
+
+class SnapshotTables(LazyMapping):
+    """The snapshot's tables, each read on first access; the fact table is
+    read from its year/month partitions (see write_partitions)"""
+
+    def __init__(self, path, partitions):
+        super().__init__(star.TABLES, self._read)
+        self.path = path
+        self.partitions = partitions
+
+    def _read(self, name):
+        return self.read_fact() if name == "fact" else _read_table(self.path, name)
+
+    def fact_size(self):
+        """Fact rows, from the partition index"""
+        return sum(part["rows"] for part in self.partitions)
+
+    def read_fact(self, start=None, end=None, columns=None):
+        """Fact rows of the partitions that can hold purchases in [start, end).
+
+        Partitions are chosen from the index alone and only ``columns`` (None
+        for all) are read from each file, whose footer locates their column
+        chunks. Rows outside the window may remain at the edges of the
+        partitions read; the result is still in purchase-time order, so
+        StarSchema.window trims it.
+        """
+        parts = [part for part in self.partitions if _overlaps(part["month"], start, end)]
+        files = [os.path.join(self.path, part["file"]) for part in parts]
+        with timing.span(f"read fact ({len(parts)}/{len(self.partitions)} partitions)"):
+            if not files:
+                # Keep the schema of an empty window
+                return pd.read_parquet(os.path.join(self.path, self.partitions[0]["file"]),
+                                       columns=columns).iloc[:0]
+            with ThreadPoolExecutor(max(1, min(schema.PARSE_WORKERS, len(files)))) as pool:
+                frames = list(pool.map(lambda file: pd.read_parquet(file, columns=columns), files))
+            return pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+
+    def read_sketches(self, start, end):
+        """HyperLogLog sketches of SKETCH_KEYS merged over the partitions of
+        the months in [start, end) (both first days of a month), and those months"""
+        lo, hi = np.datetime64(pd.Timestamp(start), "M"), np.datetime64(pd.Timestamp(end), "M")
+        merged, months = {}, []
+        for part in self.partitions:
+            month = part["month"]
+            if month is None or not lo <= np.datetime64(month, "M") < hi:
+                continue
+            with np.load(os.path.join(self.path, part["sketches"])) as data:
+                for name in SKETCH_KEYS:
+                    hll = sketch.HyperLogLog(data[name])
+                    merged[name] = merged[name].merge(hll) if name in merged else hll
+            months.append(month)
+        return merged, months
+
+
+def _read_artifact(path, name):
+    try:
+        with timing.span(f"read {name}"), open(os.path.join(path, "artifacts", f"{name}.pkl"), "rb") as f:
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, AttributeError, ImportError):
+        # Artifacts are derived; callers fall back to the fact table
+        return None
+
+
+def read_snapshot(data_path, manifest, lazy=False):
+    """The snapshot's model; with ``lazy`` each table and artifact is only
+    read from disk the first time it is used"""
+    path = snapshot_dir(data_path)
+    tables = SnapshotTables(path, manifest["partitions"])
+    if lazy:
+        artifacts = LazyMapping(manifest["artifacts"], lambda name: _read_artifact(path, name))
+    else:
+        tables = dict(tables)
+        artifacts = {name: _read_artifact(path, name) for name in manifest["artifacts"]}
+        if any(artifact is None for artifact in artifacts.values()):
+            # Callers rebuild the artifacts when there are none
+            artifacts = {}
+    model = star.StarSchema.from_tables(tables, manifest["columns"])
+    model.increments = manifest["increments"]
+    model.artifacts = artifacts
+    return model
+
+
+def save_dataset(data_path, model):
+    """Re-key and rewrite the snapshot after ``model`` was updated from the
+    one on disk (e.g. by an incremental drop); the source fingerprints are kept"""
+    manifest = _read_manifest(snapshot_dir(data_path))
+    if manifest is None:
+        return
+    model.key = dataset_key(manifest["sources"], model.increments["files"])
+    write_snapshot(data_path, model, manifest["sources"])
+
+
+def load_dataset(data_path, use_snapshot=True, prepare=None, build=None, mode="memory", lazy=False):
+    """Load the star-schema model, using the snapshot when it is fresh.
+
+    Returns the model plus ``"snapshot"`` or ``"csv"`` to say where it came
+    from. The snapshot is rebuilt whenever any source CSV changes; a freshly
+    built model is passed through ``prepare`` (if given) before it is keyed
+    and written. ``build`` replaces build_dataset; a snapshot is only reused
+    by builds of the same ``mode`` (e.g. "streaming", see stream.py) and
+    review policy (see star.order_reviews). With
+    ``lazy`` a fresh snapshot is opened without reading any table or
+    artifact until it is used (see read_snapshot).
+    """
+    prepare = prepare or (lambda model: model)
+    build = build or build_dataset
+    if not (use_snapshot and HAS_PYARROW):
+        model = prepare(build(data_path))
+        model.key = dataset_key(fingerprint(data_path), model.increments["files"])
+        return model, "csv"
+
+    manifest = _read_manifest(snapshot_dir(data_path))
+    if manifest and (manifest.get("mode") != mode
+                     or manifest.get("review_policy") != star.REVIEW_POLICY):
+        manifest = None
+    previous = manifest["sources"] if manifest else None
+    sources = fingerprint(data_path, previous)
+    if manifest and _same_content(sources, previous):
+        if sources != previous:
+            # Files were touched but not changed: remember the new mtimes
+            try:
+                _write_manifest(snapshot_dir(data_path), dict(manifest, sources=sources))
+            except OSError:
+                pass
+        with timing.span("read snapshot"):
+            model = read_snapshot(data_path, manifest, lazy)
+        model.key = dataset_key(sources, model.increments["files"])
+        return model, "snapshot"
+
+    with timing.span("build from CSV"):
+        model = prepare(build(data_path))
+    model.key = dataset_key(sources, model.increments["files"])
+
+    try:
+        write_snapshot(data_path, model, sources, mode)
+    except OSError:
+        # Read-only data folder: serve from CSV without caching
+        pass
+    return model, "csv"
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    # Build step: python dashboard/ingest.py [data_path]
+    path = sys.argv[1] if len(sys.argv) > 1 else find_data_path()
+    if path is None:
+        sys.exit("orders_dataset.csv not found")
+    start = time.perf_counter()
+    model, source = load_dataset(path)
+    print(f"{len(model.fact):,} fact rows from {source} in {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,60 @@
+"""Per-product aggregates behind the Product Clustering page"""
+import numpy as np
+import pandas as pd
+
+import backend
+
+# Fact columns product_stats reads
+FACT_COLUMNS = ["product_key", "price", "review_score"]
+
+
+def product_stats(model, rows=None):
+    """Item count, price sum and review sums per product key.
+
+    The sums are additive, so the table is kept as a model artifact and
+    patched (or folded across chunks) with ``combine``. ``rows`` restricts
+    the fact rows, as in cube.build_cube. Runs on the active compute backend
+    (see backend.py).
+    """
+    run = backend.query("product_stats")
+    if run is not None:
+        return run(model, rows)
+    fact = model.fact if rows is None else model.fact.iloc[rows]
+    key = fact["product_key"].to_numpy()
+    price = fact["price"].to_numpy(dtype="float64")
+    review = fact["review_score"].to_numpy(dtype="float64", na_value=np.nan)
+    has_review = ~np.isnan(review)
+    n = len(model["products"])
+    return pd.DataFrame({
+        "items": np.bincount(key, minlength=n),
+        "price_sum": np.bincount(key, weights=price, minlength=n),
+        "reviews": np.bincount(key[has_review], minlength=n),
+        "review_sum": np.bincount(key[has_review], weights=review[has_review], minlength=n),
+    }).rename_axis("product_key")
+
+
+def combine(stats, other, sign=1):
+    """``stats`` plus ``sign`` times ``other``; the product keys may differ in range"""
+    out = stats.add(other * sign, fill_value=0)
+    return out.astype({"items": "int64", "reviews": "int64"})
+
+
+def product_table(model, stats=None, rows=None):
+    """Avg_Price, Avg_Review and Sales_Count of every product with sales.
+
+    ``rows`` restricts the fact rows; the "products" artifact covers them all.
+    """
+    if stats is None and rows is None:
+        stats = model.artifacts.get("products")
+    if stats is None:
+        stats = product_stats(model, rows)
+    stats = stats[stats["items"] > 0]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        avg_review = (stats["review_sum"] / stats["reviews"]).where(stats["reviews"] > 0)
+    product_ids = pd.Index(model["products"]["product_id"])
+    return pd.DataFrame({
+        "product_id": pd.Categorical.from_codes(stats.index.to_numpy(), categories=product_ids),
+        "Avg_Price": (stats["price_sum"] / stats["items"]).to_numpy(),
+        "Avg_Review": avg_review.to_numpy(),
+        "Sales_Count": stats["items"].to_numpy(),
+    })
@@ -0,0 +1,572 @@
+"""Headless report engine: every dashboard page's metrics and tables without Streamlit.
+
+Each page function returns a dict with "metrics" (scalars) and "tables"
+(DataFrames or Series). The dashboard renders these results; the CLI writes
+them to JSON and Parquet so a nightly job can precompute everything the
+dashboard displays:
+
+    python dashboard/report.py --out reports/ --workers 4
+"""
+import datetime
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import cohort
+import cube
+import geo
+import incremental
+import ingest
+import products
+import rfm
+import rules
+import shared
+import sketch
+import sla
+import timing
+
+PAGES = ["overview", "business_questions", "rfm", "geospatial", "product_clustering", "cohorts",
+         "delivery"]
+
+# Product Clustering bins
+PRICE_BINS = [0, 50, 100, 200, 500, 1000]
+PRICE_LABELS = ["Very Low", "Low", "Medium", "High", "Very High"]
+REVIEW_BINS = [0, 2, 3, 4, 5]
+REVIEW_LABELS = ["Poor", "Fair", "Good", "Excellent"]
+SALES_LABELS = ["Low Seller", "Moderate Seller", "Good Seller", "Top Seller"]
+
+# Columns each page reads through the fact table; a date window reads only
+# the fact columns behind them (see window_rows)
+PAGE_COLUMNS = {
+    "overview": cube.SOURCE_COLS,
+    "business_questions": cube.SOURCE_COLS,
+    "rfm": rfm.FACT_COLUMNS,
+    "geospatial": geo.FACT_COLUMNS,
+    "product_clustering": products.FACT_COLUMNS,
+    "cohorts": cohort.FACT_COLUMNS,
+    "delivery": sla.SOURCE_COLS,
+}
+
+
+def model_cube(model, rows=None):
+    """The model's cube artifact, built on the fly when it is missing.
+
+    With ``rows`` (e.g. a date window, see StarSchema.window) the cube is
+    built from those fact rows only.
+    """
+    data_cube = model.artifacts.get("cube") if rows is None else None
+    if data_cube is None:
+        with timing.span("build cube"):
+            data_cube = cube.build_cube(model, rows)
+    return data_cube
+
+
+def whole_months(start, end):
+    """First and last month boundaries inside [start, end): the whole months
+    of the window are [first, last) when first < last"""
+    first = start.to_period("M").start_time
+    if first < start:
+        first += pd.DateOffset(months=1)
+    return first, end.to_period("M").start_time
+
+
+def approximate_cube(model, start, end):
+    """Cube of purchases in [start, end) for the approximate mode; None when
+    the model keeps no whole-history cube or partition sketches.
+
+    Whole months are cut from the whole-history cube, whose cells are per
+    month, and the partial months at the edges are built from their fact
+    rows, so every measure and the distinct orders stay exact and only the
+    edge partitions are read. Distinct customers, products and sellers do
+    not add up across months: they are HyperLogLog estimates, merged from
+    the whole months' partition sketches and the edge rows.
+    """
+    history = model.artifacts.get("cube")
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    first, last = whole_months(start, end)
+    found = model.sketches(first, last) if first < last else None
+    if history is None or found is None:
+        return None
+    # Months without partitions (e.g. a window without orders) have no sketches
+    distinct = {name: found[0].get(name) or sketch.HyperLogLog.empty() for name in ingest.SKETCH_KEYS}
+    with timing.span("approximate cube"):
+        data_cube = cube.month_slice(history, first, last)
+        for lo, hi in [(start, first), (last, end)]:
+            if lo >= hi:
+                continue
+            edge = cube.build_cube(*window_rows(model, "overview", lo, hi))
+            data_cube = data_cube.combine(edge)
+            for name in ingest.SKETCH_KEYS:
+                hll = distinct.get(name) or sketch.HyperLogLog.empty()
+                edge_keys = np.flatnonzero(edge.key_counts[name])
+                distinct[name] = hll.merge(sketch.HyperLogLog.of(edge_keys, hll.precision))
+    data_cube.distinct = distinct
+    return data_cube
+
+
+def overview(data_cube):
+    """Overview page: headline metrics, monthly orders, status, categories and reviews"""
+    with timing.span("cube rollups"):
+        return _overview(data_cube)
+
+
+def _overview(data_cube):
+    totals = data_cube.totals
+    overall = data_cube.rollup("items", [])
+    total_revenue = overall["revenue"].iloc[0]
+    reviews = overall["reviews"].iloc[0]
+
+    monthly_orders = data_cube.rollup("orders", ["order_year", "order_month"])
+    monthly_orders = monthly_orders.rename(columns={"orders": "order_id"})
+    monthly_orders["date"] = pd.to_datetime(
+        monthly_orders["order_year"].astype(str) + "-" +
+        monthly_orders["order_month"].astype(str) + "-01"
+    )
+
+    status_counts = data_cube.rollup("items", ["order_status"]).set_index("order_status")["item_count"]
+
+    top_categories = data_cube.rollup("items", ["product_category_name_english"])
+    top_categories = top_categories.rename(columns={"revenue": "price"})[
+        ["product_category_name_english", "price"]
+    ].sort_values("price", ascending=False).head(10)
+
+    return {
+        "metrics": {
+            "total_orders": totals["orders"],
+            "total_revenue": total_revenue,
+            "total_customers": totals["customers"],
+            # A window without orders has zero KPIs and empty tables
+            "avg_order_value": total_revenue / totals["orders"] if totals["orders"] else 0.0,
+            "avg_review": overall["review_sum"].iloc[0] / reviews if reviews else 0.0,
+            "total_products": totals["products"],
+            "total_sellers": totals["sellers"],
+            "first_purchase": totals["first_purchase"] and totals["first_purchase"].date(),
+            "last_purchase": totals["last_purchase"] and totals["last_purchase"].date(),
+            # Relative standard error of the distinct customers, products and sellers
+            "distinct_error": data_cube.distinct["customers"].error if data_cube.approximate else 0.0,
+        },
+        "tables": {
+            "monthly_orders": monthly_orders,
+            "status_counts": status_counts.sort_values(ascending=False),
+            "top_categories": top_categories,
+            "review_distribution": data_cube.rollup("items", ["review_score"]).set_index("review_score")["item_count"],
+        },
+    }
+
+
+def business_questions(data_cube):
+    """Business Questions page: delivery vs review in 2017, category revenue in 2018.
+
+    A question whose year has no orders in the cube is left out of the
+    result; "years" lists the years present.
+    """
+    with timing.span("cube rollups"):
+        return _business_questions(data_cube)
+
+
+def _business_questions(data_cube):
+    # Each question covers one year; a date window may leave it out
+    years = sorted(int(year) for year in data_cube.rollup("orders", ["order_year"])["order_year"])
+    metrics, tables = {"years": years}, {}
+
+    # Question 1: delivery performance vs satisfaction (2017)
+    if 2017 in years:
+        delay_stats = cube.review_stats(
+            data_cube.rollup("items", ["is_delayed"], where={"order_year": 2017})
+        ).rename(columns={"review_mean": "mean", "reviews": "count", "review_std": "std"})
+
+        by_delay = delay_stats.set_index("is_delayed").reindex([False, True])
+        on_time_avg, delayed_avg = by_delay["mean"].to_numpy()
+        difference = on_time_avg - delayed_avg
+        on_time_pct = by_delay["count"].iloc[0] / delay_stats["count"].sum() * 100
+        metrics.update({
+            "on_time_avg": on_time_avg,
+            "delayed_avg": delayed_avg,
+            "difference": difference,
+            "difference_pct": difference / on_time_avg * 100,
+            "on_time_pct": on_time_pct,
+        })
+        tables["delay_stats"] = delay_stats
+        tables["review_2017"] = data_cube.rollup("items", ["is_delayed", "review_score"],
+                                                 where={"order_year": 2017})
+
+    # Question 2: top 5 categories' revenue contribution (2018)
+    if 2018 in years:
+        where_2018 = {"order_year": 2018}
+        category_revenue = data_cube.rollup("items", ["product_category_name_english"], where=where_2018)
+        category_orders = data_cube.rollup("category_orders", ["product_category_name_english"],
+                                           where=where_2018)
+        category_stats = category_revenue[["product_category_name_english", "revenue"]].merge(
+            category_orders, on="product_category_name_english"
+        ).sort_values("revenue", ascending=False).head(5).reset_index(drop=True)
+        category_stats.columns = ["Category", "Total_Revenue", "Total_Orders"]
+        category_stats["Avg_Price"] = category_stats["Total_Revenue"] / category_stats["Total_Orders"]
+
+        total_revenue_2018 = data_cube.rollup("items", [], where=where_2018)["revenue"].iloc[0]
+        category_stats["Contribution_%"] = (category_stats["Total_Revenue"] / total_revenue_2018 * 100)
+        others_revenue = total_revenue_2018 - category_stats["Total_Revenue"].sum()
+        metrics.update({
+            "total_revenue_2018": total_revenue_2018,
+            "top_5_contribution": category_stats["Contribution_%"].sum(),
+            "top_category": category_stats.iloc[0]["Category"],
+            "top_revenue": category_stats.iloc[0]["Total_Revenue"],
+            "others_pct": others_revenue / total_revenue_2018 * 100,
+        })
+        tables["category_stats"] = category_stats
+
+    return {"metrics": metrics, "tables": tables}
+
+
+def rfm_analysis(model, reference_date=None, method="cut", rows=None):
+    """RFM page: scored customers and per-segment customers and revenue"""
+    rfm_table = rfm.compute_rfm(model, reference_date, method, rows)
+    with timing.span("segment summary"):
+        segments = rfm.segment_summary(rfm_table)
+    # No customers (a window without delivered orders): zero averages
+    means = rfm_table[["Recency", "Frequency", "Monetary"]].mean().fillna(0.0)
+    return {
+        "metrics": {
+            "total_customers": len(rfm_table),
+            "avg_recency": means["Recency"],
+            "avg_frequency": means["Frequency"],
+            "avg_monetary": means["Monetary"],
+        },
+        "tables": {
+            "rfm": rfm_table,
+            "segments": segments,
+        },
+    }
+
+
+def geospatial(model, index, rows=None):
+    """Geospatial page: per-state orders, revenue, review and centroid"""
+    with timing.span("state summary"):
+        state_summary = geo.state_summary(model, index, rows)
+    # A window without orders has no top state
+    top = state_summary.iloc[0] if len(state_summary) else {"State": None, "Total_Orders": 0}
+    total_orders = state_summary["Total_Orders"].sum()
+    return {
+        "metrics": {
+            "total_states": len(state_summary),
+            "top_state": top["State"],
+            "top_state_orders": top["Total_Orders"],
+            "concentration": top["Total_Orders"] / total_orders * 100 if total_orders else 0.0,
+        },
+        "tables": {"state_summary": state_summary},
+    }
+
+
+def product_clustering(model, rows=None, approximate=False):
+    """Product Clustering page: per-product price/review/sales bins and segments.
+
+    With ``approximate`` the sales quartiles come from a quantile sketch
+    (see sketch.QuantileSketch) instead of a sort.
+    """
+    # Per-product sums come from the "products" artifact when present
+    with timing.span("product stats"):
+        product_data = products.product_table(model, rows=rows)
+
+    # Filter
+    product_data = product_data[
+        (product_data["Avg_Price"] > 0) &
+        (product_data["Avg_Price"] < 1000) &
+        (product_data["Sales_Count"] >= 5)
+    ]
+
+    # Binning
+    with timing.span("cut"):
+        product_data["Price_Category"] = pd.cut(product_data["Avg_Price"],
+                                                bins=PRICE_BINS, labels=PRICE_LABELS)
+        product_data["Review_Category"] = pd.cut(product_data["Avg_Review"],
+                                                 bins=REVIEW_BINS, labels=REVIEW_LABELS)
+        quartiles = [0, 0.25, 0.50, 0.75, 1.0]
+        if approximate:
+            sales_sketch = sketch.QuantileSketch.of(product_data["Sales_Count"])
+            # Counts are integers: rounding undoes the sketch's error below 50 sales
+            sales_quantiles = pd.Series(sales_sketch.quantile(quartiles).round(), index=quartiles)
+        else:
+            sales_quantiles = product_data["Sales_Count"].quantile(quartiles)
+        # Narrow date windows can tie quartiles; the top bins keep their labels
+        sales_bins = sales_quantiles.dropna().drop_duplicates().tolist()
+        if len(sales_bins) > 1:
+            product_data["Sales_Performance"] = pd.cut(product_data["Sales_Count"], bins=sales_bins,
+                                                       labels=SALES_LABELS[5 - len(sales_bins):])
+        else:
+            product_data["Sales_Performance"] = pd.Categorical([None] * len(product_data),
+                                                               categories=SALES_LABELS)
+
+    # Segmentation (rules in segment_rules.json)
+    with timing.span("segment rules"):
+        product_data["Product_Segment"] = rules.load_rules()["product"].apply(product_data)
+
+    return {
+        "metrics": {
+            "total_products": len(product_data),
+            "avg_price": product_data["Avg_Price"].mean(),
+            "avg_review": product_data["Avg_Review"].mean(),
+            "avg_sales": product_data["Sales_Count"].mean(),
+            # Relative error of the sales quartiles
+            "quantile_error": sketch.QUANTILE_ERROR if approximate else 0.0,
+        },
+        "tables": {
+            "products": product_data,
+            "price_distribution": product_data["Price_Category"].value_counts(),
+            "review_distribution": product_data["Review_Category"].value_counts(),
+            "segment_counts": product_data["Product_Segment"].value_counts(),
+        },
+    }
+
+
+def cohort_retention(model, rows=None):
+    """Cohort Retention page: active customers and revenue per first-purchase
+    month and months since, and the retention they add up to"""
+    with timing.span("cohort matrices"):
+        months, tables = cohort.cohort_tables(model, rows)
+    customers = tables["customers"]
+    sizes = customers[0] if 0 in customers else pd.Series(dtype="int64")
+    # Month-1 retention over the cohorts old enough to have a month 1
+    old = tables["retention"][1].dropna().index if 1 in customers else sizes.index[:0]
+    observed = sizes[old].sum()
+    active_months = np.bincount(months["customer_unique_key"].to_numpy())
+    return {
+        "metrics": {
+            "total_cohorts": len(sizes),
+            "total_customers": int(sizes.sum()),
+            "month_1_retention": customers.loc[old, 1].sum() / observed * 100 if observed else 0.0,
+            # Customers who bought again in a later month
+            "repeat_rate": (active_months > 1).sum() / sizes.sum() * 100 if sizes.sum() else 0.0,
+        },
+        "tables": {**tables, "cohort_sizes": sizes},
+    }
+
+
+def delay_histograms(model, start=None, end=None):
+    """Delay histograms of purchases in [start, end), exact.
+
+    Whole months are cut from the whole-history "sla" artifact, whose cells
+    are per month, and only the partial months at the edges are built from
+    their fact rows (see approximate_cube). Without the artifact every row
+    of the window is read.
+    """
+    history = model.artifacts.get("sla")
+    if history is None:
+        with timing.span("build delay histograms"):
+            return sla.build_histograms(*window_rows(model, "delivery", start, end))
+    if start is None and end is None:
+        return history
+    start = pd.Timestamp(start) if start is not None else pd.Timestamp(model["dates"]["order_date"].iloc[0])
+    end = pd.Timestamp(end) if end is not None else (
+        pd.Timestamp(model["dates"]["order_date"].iloc[-1]) + pd.Timedelta(days=1))
+    first, last = whole_months(start, end)
+    if first >= last:
+        with timing.span("build delay histograms"):
+            return sla.build_histograms(*window_rows(model, "delivery", start, end))
+    histograms = history.select(start=first, end=last)
+    for lo, hi in [(start, first), (last, end)]:
+        if lo < hi:
+            with timing.span("edge delay histograms"):
+                histograms = histograms.combine(
+                    sla.build_histograms(*window_rows(model, "delivery", lo, hi)), fold=False)
+    return histograms
+
+
+def delivery_sla(model, start=None, end=None, where=None):
+    """Delivery SLA page: on-time rate, delay percentiles and the delay vs
+    review breakdown, overall and by month, state and category.
+
+    Every table is a sum of the delay histograms (see sla.py); ``where``
+    narrows them to cells, e.g. {"seller_state": "SP"}.
+    """
+    histograms = delay_histograms(model, start, end)
+    with timing.span("sum histograms"):
+        histograms = histograms.select(where)
+        total = histograms.counts(reviews=True)[0]
+        overall = sla.summarize(total.sum(axis=-1), histograms.counts(value="delay_days")[0]).iloc[0]
+        tables = {"delay_reviews": sla.delay_reviews(total),
+                  "delay_histogram": pd.DataFrame({"Delay": sla.DELAYS,
+                                                   "Items": total.sum(axis=-1)})}
+        for name, dim, label in [("monthly", "month", "Month"),
+                                 ("customer_states", "customer_state", "Customer_State"),
+                                 ("seller_states", "seller_state", "Seller_State"),
+                                 ("categories", "category", "Category")]:
+            counts, labels = histograms.counts(by=dim)
+            summary = sla.summarize(counts, histograms.counts(by=dim, value="delay_days")[0],
+                                    labels, label)
+            tables[name] = summary[summary["Delivered"] > 0].reset_index(drop=True)
+    return {
+        "metrics": {
+            "delivered": int(overall["Delivered"]),
+            "on_time_pct": overall["On_Time_%"],
+            "avg_delay": overall["Avg_Delay"],
+            "p50_delay": overall["P50_Delay"],
+            "p90_delay": overall["P90_Delay"],
+            "p95_delay": overall["P95_Delay"],
+        },
+        "tables": tables,
+    }
+
+
+def window_rows(model, page=None, start=None, end=None):
+    """``model`` narrowed to a date window for ``page``, and the window's fact rows.
+
+    Reads only the fact partitions of [start, end) and the columns the page
+    uses (just the purchase time for no page; see StarSchema.prune). Without
+    a window the model is returned whole, with rows None, so the pages use
+    its whole-history artifacts.
+    """
+    if start is None and end is None:
+        return model, None
+    model = model.prune(start, end, model.fact_columns(PAGE_COLUMNS.get(page, [])))
+    return model, model.window(start, end)
+
+
+def compute_page(model, page, data_path=None, reference_date=None, method="cut",
+                 start=None, end=None, approximate=sketch.APPROXIMATE):
+    """Result of one page by name (see PAGES).
+
+    ``start`` and ``end`` restrict every page to purchases in [start, end).
+    ``approximate`` serves a window's distinct counts and the sales
+    quartiles from sketches (see approximate_cube and product_clustering).
+    """
+    if page in ("overview", "business_questions"):
+        data_cube = None
+        if approximate and start is not None and end is not None:
+            data_cube = approximate_cube(model, start, end)
+        if data_cube is None:
+            data_cube = model_cube(*window_rows(model, page, start, end))
+        return overview(data_cube) if page == "overview" else business_questions(data_cube)
+    if page == "delivery":
+        # Whole months of a window come from the histograms artifact
+        return delivery_sla(model, start, end)
+    model, rows = window_rows(model, page, start, end)
+    if page == "rfm":
+        return rfm_analysis(model, reference_date, method, rows)
+    if page == "geospatial":
+        return geospatial(model, geo.load_geo_index(data_path), rows)
+    if page == "product_clustering":
+        return product_clustering(model, rows, approximate)
+    if page == "cohorts":
+        return cohort_retention(model, rows)
+    raise ValueError(f"Unknown page {page!r}; expected one of {PAGES}")
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (pd.Timestamp, datetime.date)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def write_page(result, out_dir):
+    """Write a page result as metrics.json plus one Parquet (or CSV) file per table"""
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, "metrics.json"), "w") as f:
+        json.dump(result["metrics"], f, indent=2, default=_json_default)
+    files = ["metrics.json"]
+    for name, table in result["tables"].items():
+        if isinstance(table, pd.Series):
+            table = table.to_frame()
+        if ingest.HAS_PYARROW:
+            filename = f"{name}.parquet"
+            table.to_parquet(os.path.join(out_dir, filename))
+        else:
+            filename = f"{name}.csv"
+            table.to_csv(os.path.join(out_dir, filename))
+        files.append(filename)
+    return files
+
+
+# Each pool worker loads the dataset once and reuses it for every page it runs
+_worker_model = None
+
+
+def _init_worker(data_path):
+    global _worker_model
+    # Attaches to the tables run_report published (see shared.py)
+    _worker_model = shared.share(data_path, incremental.refresh(data_path)[0])
+
+
+def _run_page(page, data_path, out_dir, options, model=None):
+    start = time.perf_counter()
+    model = model or _worker_model
+    result = compute_page(model, page, data_path, **options)
+    files = write_page(result, os.path.join(out_dir, page))
+    return page, {"seconds": round(time.perf_counter() - start, 3), "files": files}
+
+
+def run_report(data_path, out_dir, pages=PAGES, workers=1, **options):
+    """Compute ``pages`` and write them under ``out_dir``; returns the manifest.
+
+    The dataset is refreshed once up front. With ``workers`` > 1 the pages
+    run in parallel on a process pool whose workers attach to the refreshed
+    tables, published once as a shared memory-mapped copy (see shared.py).
+    Pages that fail (e.g. geospatial without geolocation data) are recorded
+    in the manifest instead of aborting the run.
+    """
+    start = time.perf_counter()
+    model, _ = incremental.refresh(data_path)
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = {"dataset_key": model.key, "generated_at": datetime.datetime.now().isoformat(),
+                "options": options, "pages": {}, "errors": {}}
+
+    if workers > 1 and len(pages) > 1:
+        shared.share(data_path, model)
+        with ProcessPoolExecutor(min(workers, len(pages)), initializer=_init_worker,
+                                 initargs=(data_path,)) as pool:
+            futures = {page: pool.submit(_run_page, page, data_path, out_dir, options)
+                       for page in pages}
+            for page, future in futures.items():
+                try:
+                    manifest["pages"][page] = future.result()[1]
+                except Exception as e:
+                    manifest["errors"][page] = repr(e)
+    else:
+        for page in pages:
+            try:
+                manifest["pages"][page] = _run_page(page, data_path, out_dir, options, model)[1]
+            except Exception as e:
+                manifest["errors"][page] = repr(e)
+
+    manifest["seconds"] = round(time.perf_counter() - start, 3)
+    with open(os.path.join(out_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2, default=_json_default)
+    return manifest
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Precompute every dashboard page to JSON/Parquet")
+    parser.add_argument("--data", help="folder with the Olist CSVs (default: auto-detect)")
+    parser.add_argument("--out", default="reports", help="output folder")
+    parser.add_argument("--pages", nargs="+", choices=PAGES, default=PAGES)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="process pool size; each worker loads the snapshot once")
+    parser.add_argument("--rfm-method", choices=rfm.SCORING_METHODS, default="cut")
+    parser.add_argument("--reference-date", help="RFM reference date (default: day after last purchase)")
+    parser.add_argument("--start", help="only purchases on or after this date")
+    parser.add_argument("--end", help="only purchases before this date")
+    parser.add_argument("--approximate", action="store_true", default=sketch.APPROXIMATE,
+                        help="distinct counts and quartiles from sketches (see sketch.py)")
+    args = parser.parse_args()
+
+    path = args.data or ingest.find_data_path()
+    if path is None:
+        sys.exit("orders_dataset.csv not found")
+    manifest = run_report(path, args.out, args.pages, args.workers,
+                          reference_date=args.reference_date, method=args.rfm_method,
+                          start=args.start, end=args.end, approximate=args.approximate)
+    for page, info in manifest["pages"].items():
+        print(f"{page:<20} {info['seconds']:>7.2f}s  {len(info['files'])} files")
+    for page, error in manifest["errors"].items():
+        print(f"{page:<20} FAILED: {error}")
+    print(f"wrote {args.out} in {manifest['seconds']:.2f}s (dataset {manifest['dataset_key']})")
+    if manifest["errors"]:
+        # Batch and cron callers see failed pages in the exit status
+        sys.exit(f"{len(manifest['errors'])} of {len(args.pages)} pages failed")
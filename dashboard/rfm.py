@@ -0,0 +1,146 @@
+"""RFM scoring and customer segmentation"""
+import numpy as np
+import pandas as pd
+
+import backend
+import rules
+import star
+import timing
+
+SCORING_METHODS = ["cut", "quantile"]
+
+# Fact columns customer_stats reads
+FACT_COLUMNS = ["customer_key", "order_key", "order_status", "order_purchase_timestamp", "price"]
+
+
+def unique_customers(model):
+    """Identity map from customer key to unique-customer key, and the
+    customer_unique_id of each unique-customer key.
+
+    Olist issues a new customer_id with every order; customer_unique_id is
+    the person behind them. The customers dimension stores it as a
+    categorical, so its codes are this map, precomputed with the snapshot;
+    drops only ever append categories (see star.append_rows), so keys stay
+    put across increments.
+    """
+    ids = model["customers"]["customer_unique_id"]
+    return ids.cat.codes.to_numpy().astype(np.int32), ids.cat.categories
+
+
+def customer_stats(model, customers=None, rows=None):
+    """Last delivered purchase, order count and spend per unique-customer key.
+
+    This is the RFM input kept as a model artifact; ``customers`` restricts
+    it to those unique-customer keys so an incremental drop only recomputes
+    the customers it touched. ``rows`` restricts the fact rows (e.g. to a
+    date window, see StarSchema.window). Reduces integer keys with bincount
+    rather than grouping; runs on the active compute backend (see
+    backend.py).
+    """
+    run = backend.query("customer_stats")
+    if run is not None:
+        return run(model, customers, rows)
+    fact = model.fact if rows is None else model.fact.iloc[rows]
+    identity, unique_ids = unique_customers(model)
+    person = identity[fact["customer_key"].to_numpy()]
+    mask = (fact["order_status"] == "delivered").to_numpy() & (person >= 0)
+    if customers is not None:
+        wanted = np.zeros(len(unique_ids), dtype=bool)
+        wanted[customers] = True
+        mask &= wanted[person]
+    person = person[mask]
+    order_key = fact["order_key"].to_numpy()[mask]
+    times = star.time_key(fact)[0][mask]
+    # An order's items sit together in the fact (see star.assemble_fact), so
+    # each order counts once, at its first item
+    first = np.ones(len(order_key), dtype=bool)
+    first[1:] = order_key[1:] != order_key[:-1]
+    frequency = np.bincount(person[first], minlength=len(unique_ids))
+    # astype: bincount of no rows returns int64 even with weights
+    monetary = np.bincount(person, weights=fact["price"].to_numpy()[mask],
+                           minlength=len(unique_ids)).astype(np.float64, copy=False)
+    # Rows are in purchase-time order, so a customer's last row is the last purchase
+    last = np.full(len(unique_ids), -1, dtype=np.int64)
+    np.maximum.at(last, person[first], np.flatnonzero(first))
+    keys = np.flatnonzero(frequency).astype(np.int32)
+    return pd.DataFrame({
+        "last_purchase": fact["order_purchase_timestamp"].array[mask].take(last[keys]),
+        "Frequency": frequency[keys],
+        "Monetary": monetary[keys],
+    }, index=pd.Index(keys, name="customer_unique_key"))
+
+
+def merge_stats(stats, other):
+    """Customer stats of two disjoint sets of fact rows, combined"""
+    merged = pd.concat([stats, other])
+    if not merged.index.has_duplicates:
+        return merged.sort_index()
+    return merged.groupby(level=0).agg(
+        last_purchase=("last_purchase", "max"),
+        Frequency=("Frequency", "sum"),
+        Monetary=("Monetary", "sum"),
+    )
+
+
+def rfm_base(model, reference_date=None, rows=None):
+    """Recency, Frequency (orders) and Monetary per unique customer from
+    delivered order items.
+
+    ``reference_date`` defaults to the day after the last delivered purchase.
+    ``rows`` restricts the fact rows; the "rfm" artifact covers them all.
+    """
+    grouped = model.artifacts.get("rfm") if rows is None else None
+    if grouped is None:
+        grouped = customer_stats(model, rows=rows)
+    if reference_date is None:
+        reference_date = grouped["last_purchase"].max() + pd.Timedelta(days=1)
+    reference_date = pd.Timestamp(reference_date)
+
+    unique_ids = unique_customers(model)[1]
+    return pd.DataFrame({
+        "customer_unique_id": pd.Categorical.from_codes(grouped.index.to_numpy(),
+                                                        categories=unique_ids),
+        "Recency": (reference_date - grouped["last_purchase"]).dt.days.to_numpy(),
+        "Frequency": grouped["Frequency"].to_numpy(),
+        "Monetary": grouped["Monetary"].to_numpy(),
+    })
+
+
+def score(values, ascending=True, method="cut"):
+    """Score ``values`` 1-5, either on 5 equal-width bins or on quintiles"""
+    labels = [1, 2, 3, 4, 5] if ascending else [5, 4, 3, 2, 1]
+    if not len(values):
+        # No customers to bin (e.g. a date window without delivered orders)
+        return pd.Series(np.empty(0, dtype=int), index=values.index)
+    if method == "quantile":
+        # Rank first so heavy ties (e.g. Frequency == 1) still split into quintiles
+        return pd.qcut(values.rank(method="first"), 5, labels=labels).astype(int)
+    return pd.cut(values, bins=5, labels=labels).astype(int)
+
+
+def segment(rfm, ruleset=None):
+    """Label customers from their R/F/M scores with the "rfm" rule set"""
+    ruleset = ruleset or rules.load_rules()["rfm"]
+    return ruleset.apply(rfm)
+
+
+def compute_rfm(model, reference_date=None, method="cut", rows=None):
+    """Scored and segmented RFM table, one row per unique customer"""
+    with timing.span("rfm base"):
+        rfm = rfm_base(model, reference_date, rows)
+    with timing.span(f"score ({method})"):
+        rfm["R_Score"] = score(rfm["Recency"], ascending=False, method=method)
+        rfm["F_Score"] = score(rfm["Frequency"], method=method)
+        rfm["M_Score"] = score(rfm["Monetary"], method=method)
+        rfm["Total_Score"] = rfm["R_Score"] + rfm["F_Score"] + rfm["M_Score"]
+    with timing.span("segment rules"):
+        rfm["Segment"] = segment(rfm)
+    return rfm
+
+
+def segment_summary(rfm):
+    """Customers and revenue per segment, largest segment first"""
+    return rfm.groupby("Segment").agg(
+        Customers=("Segment", "size"),
+        Revenue=("Monetary", "sum"),
+    ).sort_values("Customers", ascending=False)
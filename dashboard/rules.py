@@ -0,0 +1,144 @@
+"""Declarative segmentation rules compiled to vectorized masks.
+
+Rule sets live in segment_rules.json. Each rule maps a segment label to
+conditions on columns of the frame being segmented; the first rule whose
+conditions all hold labels the row, otherwise the rule set's default does.
+A condition is either a value (equality), a list of values (membership) or
+an ``{"<op>": value}`` mapping with one of the operators in OPERATORS.
+"""
+import json
+import operator
+import os
+
+import numpy as np
+
+RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "segment_rules.json")
+
+OPERATORS = {
+    ">=": operator.ge,
+    ">": operator.gt,
+    "<=": operator.le,
+    "<": operator.lt,
+    "==": operator.eq,
+    "!=": operator.ne,
+    "in": lambda a, b: a in b,
+}
+
+
+def _conditions(when):
+    """Normalize a rule's ``when`` block to a list of (column, op, value)"""
+    conditions = []
+    for col, spec in when.items():
+        if isinstance(spec, dict):
+            items = spec.items()
+        elif isinstance(spec, list):
+            items = [("in", spec)]
+        else:
+            items = [("==", spec)]
+        for op, value in items:
+            if op not in OPERATORS:
+                raise ValueError(f"Unknown operator {op!r} for column {col!r}")
+            conditions.append((col, op, value))
+    return conditions
+
+
+class RuleSet:
+    """Ordered rules compiled into a single vectorized np.select pass"""
+
+    def __init__(self, rules, default):
+        self.rules = [(rule["segment"], _conditions(rule["when"])) for rule in rules]
+        self.default = default
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config["rules"], config["default"])
+
+    def _mask(self, df, conditions):
+        mask = np.ones(len(df), dtype=bool)
+        for col, op, value in conditions:
+            series = df[col]
+            # isin works on codes for categoricals and treats NaN as no match
+            if op == "in":
+                mask &= series.isin(value).to_numpy()
+            elif op == "==":
+                mask &= series.isin([value]).to_numpy()
+            elif op == "!=":
+                mask &= ~series.isin([value]).to_numpy()
+            else:
+                mask &= np.asarray(OPERATORS[op](series.to_numpy(), value), dtype=bool)
+        return mask
+
+    def apply(self, df):
+        """Segment label for every row of ``df``"""
+        masks = [self._mask(df, conditions) for _, conditions in self.rules]
+        return np.select(masks, [label for label, _ in self.rules], default=self.default)
+
+    def label_row(self, row):
+        """Label a single row; the if/elif equivalent of apply()"""
+        for label, conditions in self.rules:
+            if all(OPERATORS[op](row[col], value) for col, op, value in conditions):
+                return label
+        return self.default
+
+    def apply_rowwise(self, df):
+        """``DataFrame.apply`` evaluation, kept as the benchmark baseline"""
+        return df.apply(self.label_row, axis=1).to_numpy()
+
+
+_loaded = {}
+
+
+def rules_version(path=RULES_PATH):
+    """Changes whenever the rules file is edited; use it to key caches"""
+    stat = os.stat(path)
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+
+def load_rules(path=RULES_PATH):
+    """Rule sets by name, re-read from disk whenever the file changes"""
+    version = rules_version(path)
+    cached = _loaded.get(path)
+    if cached is None or cached[0] != version:
+        with open(path) as f:
+            config = json.load(f)
+        cached = (version, {name: RuleSet.from_config(spec) for name, spec in config.items()})
+        _loaded[path] = cached
+    return cached[1]
+
+
+def _bench(sizes, apply_limit, seed=0):
+    import time
+
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    ruleset = load_rules()["rfm"]
+    print(f"apply baseline timed on the first {apply_limit:,} rows of each size")
+    print(f"{'rows':>12} {'vectorized rows/s':>18} {'apply rows/s':>14} {'speedup':>8}")
+
+    for n in sizes:
+        df = pd.DataFrame({col: rng.integers(1, 6, n, dtype=np.int8)
+                           for col in ["R_Score", "F_Score", "M_Score"]})
+        start = time.perf_counter()
+        vectorized = ruleset.apply(df)
+        vec_rate = n / (time.perf_counter() - start)
+
+        # The row-wise path is timed on at most apply_limit rows
+        sample = df.iloc[:apply_limit]
+        start = time.perf_counter()
+        rowwise = ruleset.apply_rowwise(sample)
+        apply_rate = len(sample) / (time.perf_counter() - start)
+        assert (rowwise == vectorized[:len(sample)]).all()
+
+        print(f"{n:>12,} {vec_rate:>18,.0f} {apply_rate:>14,.0f} {vec_rate / apply_rate:>7.0f}x")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark vectorized rules against DataFrame.apply")
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 10_000_000])
+    parser.add_argument("--apply-limit", type=int, default=100_000,
+                        help="rows used to time the row-wise apply baseline")
+    args = parser.parse_args()
+    _bench(args.rows, args.apply_limit)
@@ -0,0 +1,210 @@
+"""Declared schema of the Olist CSVs and the concurrent table reader.
+
+Every table lists its columns' dtypes, its 32-char hex ID columns and its
+timestamp columns, all written as DATETIME_FORMAT. Reading with declared
+dtypes skips pandas' per-column type inference and explicit formats skip
+pd.to_datetime's format guessing; low-cardinality text is parsed straight
+into categoricals. read_tables parses the tables concurrently on a thread
+pool with the pyarrow CSV engine when it is installed (which also releases
+the GIL while parsing), otherwise the C engine.
+
+The parse report compares this reader with the previous one (sequential
+read_csv with type inference, then format-less datetime parsing), each in a
+fresh process so its peak RSS is its own:
+
+    python dashboard/schema.py [data_path]
+"""
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+    ENGINE = "pyarrow"
+except ImportError:
+    ENGINE = "c"
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Tables parsed at once (override with DASHBOARD_PARSE_WORKERS)
+PARSE_WORKERS = int(os.environ.get("DASHBOARD_PARSE_WORKERS", min(8, os.cpu_count() or 1)))
+
+# Column dtypes per table; "ids" are hex keys read as text, "dates" are
+# parsed with DATETIME_FORMAT. product_category_name stays text because the
+# products and translation tables are merged on it.
+SCHEMAS = {
+    "orders": {
+        "ids": ["order_id", "customer_id"],
+        "dtypes": {"order_status": "category"},
+        "dates": ["order_purchase_timestamp", "order_approved_at", "order_delivered_carrier_date",
+                  "order_delivered_customer_date", "order_estimated_delivery_date"],
+    },
+    "order_items": {
+        "ids": ["order_id", "product_id", "seller_id"],
+        "dtypes": {"order_item_id": "int64", "price": "float64", "freight_value": "float64"},
+        "dates": ["shipping_limit_date"],
+    },
+    "products": {
+        "ids": ["product_id"],
+        "dtypes": {"product_category_name": "str",
+                   "product_name_lenght": "float64", "product_description_lenght": "float64",
+                   "product_photos_qty": "float64", "product_weight_g": "float64",
+                   "product_length_cm": "float64", "product_height_cm": "float64",
+                   "product_width_cm": "float64"},
+        "dates": [],
+    },
+    "customers": {
+        "ids": ["customer_id", "customer_unique_id"],
+        "dtypes": {"customer_zip_code_prefix": "int64", "customer_city": "category",
+                   "customer_state": "category"},
+        "dates": [],
+    },
+    "reviews": {
+        "ids": ["review_id", "order_id"],
+        "dtypes": {"review_score": "int64", "review_comment_title": "str",
+                   "review_comment_message": "str"},
+        "dates": ["review_creation_date", "review_answer_timestamp"],
+    },
+    "category": {
+        "ids": [],
+        "dtypes": {"product_category_name": "str", "product_category_name_english": "str"},
+        "dates": [],
+    },
+    "sellers": {
+        "ids": ["seller_id"],
+        "dtypes": {"seller_zip_code_prefix": "int64", "seller_city": "category",
+                   "seller_state": "category"},
+        "dates": [],
+    },
+    "payments": {
+        "ids": ["order_id"],
+        "dtypes": {"payment_sequential": "int64", "payment_type": "category",
+                   "payment_installments": "int64", "payment_value": "float64"},
+        "dates": [],
+    },
+    "geolocation": {
+        "ids": [],
+        "dtypes": {"geolocation_zip_code_prefix": "int64", "geolocation_lat": "float64",
+                   "geolocation_lng": "float64", "geolocation_city": "str",
+                   "geolocation_state": "category"},
+        "dates": [],
+    },
+}
+
+
+def header(path):
+    """Column names of a CSV file"""
+    return list(pd.read_csv(path, nrows=0).columns)
+
+
+def read_csv(path, table, usecols=None, chunksize=None):
+    """Read one CSV with the declared schema of ``table``.
+
+    Columns the schema does not declare are left to type inference, so an
+    extra column in a new export still loads. ``chunksize`` returns an
+    iterator of frames (read with the C engine, which supports it).
+    """
+    spec = SCHEMAS[table]
+    columns = [col for col in header(path) if usecols is None or col in usecols]
+    dtypes = dict.fromkeys(spec["ids"], "str")
+    dtypes.update(spec["dtypes"])
+    dates = [col for col in spec["dates"] if col in columns]
+    kwargs = dict(usecols=usecols, dtype={col: dtypes[col] for col in columns if col in dtypes},
+                  parse_dates=dates, date_format=DATETIME_FORMAT)
+    if chunksize is not None:
+        return (_datetime_units(chunk, dates)
+                for chunk in pd.read_csv(path, chunksize=chunksize, **kwargs))
+    return _datetime_units(pd.read_csv(path, engine=ENGINE, **kwargs), dates)
+
+
+def _datetime_units(df, dates):
+    # The pyarrow engine yields second resolution; keep the C engine's
+    # microseconds so frames from either engine concatenate unchanged
+    for col in dates:
+        if df[col].dtype != "datetime64[us]":
+            df[col] = df[col].astype("datetime64[us]")
+    return df
+
+
+def read_tables(data_path, files, usecols=None, workers=PARSE_WORKERS):
+    """``files`` (table name -> file name in ``data_path``) read concurrently.
+
+    ``usecols`` optionally maps a table name to the columns to keep.
+    """
+    usecols = usecols or {}
+    with ThreadPoolExecutor(max(1, min(workers, len(files)))) as pool:
+        futures = {name: pool.submit(read_csv, os.path.join(data_path, filename), name,
+                                     usecols.get(name))
+                   for name, filename in files.items()}
+        return {name: future.result() for name, future in futures.items()}
+
+
+def infer_tables(data_path, files):
+    """The previous loader, kept as the parse report's baseline: sequential
+    read_csv with type inference, then format-less datetime parsing"""
+    tables = {name: pd.read_csv(os.path.join(data_path, filename))
+              for name, filename in files.items()}
+    for name, table in tables.items():
+        for col in SCHEMAS[name]["dates"]:
+            if col in table.columns:
+                table[col] = pd.to_datetime(table[col])
+    return tables
+
+
+LOADERS = {"inferred": infer_tables, "schema": read_tables}
+
+
+def _measure(loader, data_path):
+    """Wall time and peak RSS of one loader run in this (fresh) process"""
+    import geo
+    import ingest
+
+    files = dict(ingest.DATA_FILES)
+    if os.path.exists(os.path.join(data_path, geo.GEO_FILE)):
+        files["geolocation"] = geo.GEO_FILE
+    start = time.perf_counter()
+    tables = LOADERS[loader](data_path, files)
+    seconds = time.perf_counter() - start
+    peak = None
+    if resource is not None:
+        # KiB on Linux, bytes on macOS
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak = maxrss / (2 ** 20 if sys.platform == "darwin" else 2 ** 10)
+    return {"seconds": seconds, "peak_rss_mib": peak,
+            "memory_mib": sum(df.memory_usage(index=False, deep=True).sum()
+                              for df in tables.values()) / 2 ** 20}
+
+
+def parse_report(data_path):
+    """Parse time, peak RSS and in-memory size of both loaders, one process each"""
+    report = {}
+    for loader in LOADERS:
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), "--measure", loader, data_path],
+                             capture_output=True, text=True, check=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        report[loader] = json.loads(out.stdout)
+    return pd.DataFrame(report).T
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "--measure":
+        print(json.dumps(_measure(sys.argv[2], sys.argv[3])))
+        sys.exit()
+
+    import ingest
+
+    path = sys.argv[1] if len(sys.argv) > 1 else ingest.find_data_path()
+    if path is None:
+        sys.exit("orders_dataset.csv not found")
+    print(f"engine {ENGINE}, {PARSE_WORKERS} workers")
+    print(parse_report(path).round(3).to_string())
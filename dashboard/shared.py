@@ -0,0 +1,168 @@
+"""Model tables published once per host as memory-mapped Arrow files.
+
+Every Streamlit server process (and every report worker) would otherwise
+read its own copy of each table out of the Parquet snapshot. share()
+publishes the model's tables once per dataset key as uncompressed Arrow IPC
+files under SHARED_DIR, then attaches to them: each table is memory-mapped
+read-only and converted without copying where Arrow and pandas share a
+layout, so the columns of every process point into the same page-cache
+pages. N workers hold one physical copy, and a new worker attaches in
+milliseconds instead of decompressing Parquet. Nullable integer columns
+(e.g. review_score) and category labels are still copied per process.
+
+A model opened from the snapshot is published by streaming its Parquet
+files to Arrow batch by batch, so publishing loads none of its tables.
+Date windows and partition sketches are still read from the snapshot's
+fact partitions (see ingest.SnapshotTables), so a window reads only the
+months it covers.
+
+Copies live in a "shared" folder of their own, under .cache next to the
+CSVs or under DASHBOARD_SHARED_DIR (e.g. a tmpfs such as /dev/shm, to keep
+the copy in memory). Publishing removes only this dataset's older copies.
+DASHBOARD_SHARED=0 turns sharing off.
+"""
+import json
+import os
+import shutil
+
+import ingest
+import star
+import timing
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+ENABLED = os.environ.get("DASHBOARD_SHARED", "1") == "1" and pa is not None
+
+# Published copies live in a "shared" folder here, one folder per dataset key
+SHARED_DIR = os.environ.get("DASHBOARD_SHARED_DIR")
+
+# Marks the manifests of copies this module published
+FORMAT = "dashboard-shared-tables"
+
+
+def shared_dir(data_path):
+    return os.path.join(SHARED_DIR or ingest.cache_dir(data_path), "shared")
+
+
+def _read_manifest(path):
+    """Manifest of a copy this module published in ``path``, or None"""
+    try:
+        with open(os.path.join(path, "manifest.json")) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return manifest if isinstance(manifest, dict) and manifest.get("format") == FORMAT else None
+
+
+def _parquet_files(source, name):
+    """Parquet files of a snapshot table, in order; None for tables in memory"""
+    if not isinstance(source, ingest.SnapshotTables):
+        return None
+    if name == "fact":
+        return [os.path.join(source.path, part["file"]) for part in source.partitions]
+    return [os.path.join(source.path, f"{name}.parquet")]
+
+
+def _write_table(path, model, name):
+    files = _parquet_files(model.source, name)
+    with pa.OSFile(path, "wb") as sink:
+        if files is None:
+            table = pa.Table.from_pandas(model[name], preserve_index=False)
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+            return
+        # Batch by batch, without reading the table into pandas; the fact
+        # partitions share one schema, categories included
+        schema = pq.ParquetFile(files[0]).schema_arrow
+        with pa.ipc.new_file(sink, schema) as writer:
+            for file in files:
+                for batch in pq.ParquetFile(file).iter_batches():
+                    writer.write_batch(batch)
+
+
+def publish(data_path, model):
+    """Write the model's tables as Arrow files for its dataset key, unless
+    another process already did; returns the folder"""
+    root = shared_dir(data_path)
+    target = os.path.join(root, model.key)
+    if _read_manifest(target) is not None:
+        return target
+    tmp = f"{target}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    with timing.span("publish shared tables"):
+        for name in star.TABLES:
+            _write_table(os.path.join(tmp, f"{name}.arrow"), model, name)
+        # Written last, as in the snapshot: a folder without it is incomplete
+        with open(os.path.join(tmp, "manifest.json"), "w") as f:
+            json.dump({"format": FORMAT, "data_path": os.path.abspath(data_path), "key": model.key,
+                       "columns": model.table_columns()}, f, indent=2)
+    try:
+        os.rename(tmp, target)
+    except OSError:
+        # Another process published the same key first
+        shutil.rmtree(tmp, ignore_errors=True)
+    # Older copies of this dataset: processes still attached keep their mappings (POSIX)
+    for other in os.listdir(root):
+        manifest = _read_manifest(os.path.join(root, other))
+        if (other != model.key and manifest is not None
+                and manifest["data_path"] == os.path.abspath(data_path)):
+            shutil.rmtree(os.path.join(root, other), ignore_errors=True)
+    return target
+
+
+def _attach_table(path, name):
+    with timing.span(f"attach {name}"):
+        # The mapping stays open for as long as the table's buffers are used
+        source = pa.memory_map(os.path.join(path, f"{name}.arrow"))
+        return pa.ipc.open_file(source).read_all().to_pandas(split_blocks=True)
+
+
+class SharedTables(ingest.LazyMapping):
+    """Tables of a published copy, each attached on first access. The fact
+    partitions and sketches of ``source`` (the model's own tables) are still
+    read through it, so StarSchema.prune and sketches work as without sharing"""
+
+    def __init__(self, path, source):
+        super().__init__(star.TABLES, lambda name: _attach_table(path, name))
+        self._source = source
+
+    def __getattr__(self, name):
+        if name in ("read_fact", "fact_size", "read_sketches"):
+            # Absent too when the source has no partitions (a model built in memory)
+            return getattr(self._source, name)
+        raise AttributeError(name)
+
+
+def attach(data_path, model):
+    """``model`` over the published copy of its tables, or None when there is none"""
+    path = os.path.join(shared_dir(data_path), model.key)
+    manifest = _read_manifest(path)
+    if manifest is None:
+        return None
+    shared = star.StarSchema.from_tables(SharedTables(path, model.source), manifest["columns"],
+                                         model.key)
+    shared.artifacts = model.artifacts
+    shared.increments = model.increments
+    return shared
+
+
+def share(data_path, model):
+    """``model`` with its tables served from the host's shared copy, which
+    is published first if needed; ``model`` itself when sharing is off or
+    the shared folder cannot be written"""
+    if not ENABLED or model.key is None:
+        return model
+    shared = attach(data_path, model)
+    if shared is None:
+        try:
+            publish(data_path, model)
+        except OSError:
+            return model
+        shared = attach(data_path, model)
+    return shared or model
@@ -0,0 +1,156 @@
+"""Mergeable sketches behind the approximate mode.
+
+HyperLogLog estimates a distinct count from 2**p one-byte registers, with
+a relative standard error of 1.04 / sqrt(2**p); two sketches merge with an
+element-wise max, so the sketches stored with each fact partition (see
+ingest.write_partitions) combine into the distinct customers, products and
+sellers of any set of months. QuantileSketch is a DDSketch: values fall in
+logarithmic buckets, so every quantile it returns is within a relative
+error ``alpha`` of an exact one, and two sketches merge by adding counts.
+
+The approximate mode is off unless DASHBOARD_APPROXIMATE=1 (the dashboard
+sidebar can also switch it on); DASHBOARD_HLL_PRECISION and
+DASHBOARD_QUANTILE_ERROR set the error bounds.
+"""
+import os
+
+import numpy as np
+
+APPROXIMATE = os.environ.get("DASHBOARD_APPROXIMATE", "0") == "1"
+
+# HyperLogLog registers are 2**HLL_PRECISION bytes per sketch
+HLL_PRECISION = int(os.environ.get("DASHBOARD_HLL_PRECISION", 14))
+
+# Relative error of QuantileSketch quantiles
+QUANTILE_ERROR = float(os.environ.get("DASHBOARD_QUANTILE_ERROR", 0.01))
+
+
+def _hash(keys):
+    """splitmix64 of integer keys: well-mixed 64-bit hashes"""
+    x = np.asarray(keys).astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def _bit_length(x):
+    # Halves of 32 bits convert to float64 exactly, so frexp gives their exact bit length
+    hi, lo = (x >> np.uint64(32)).astype(np.float64), (x & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    return np.where(hi > 0, 32 + np.frexp(hi)[1], np.frexp(lo)[1])
+
+
+class HyperLogLog:
+    """Distinct-count estimate of integer keys"""
+
+    def __init__(self, registers):
+        self.registers = registers
+
+    @classmethod
+    def empty(cls, precision=HLL_PRECISION):
+        return cls(np.zeros(2 ** precision, dtype=np.uint8))
+
+    @classmethod
+    def of(cls, keys, precision=HLL_PRECISION):
+        sketch = cls.empty(precision)
+        sketch.add(keys)
+        return sketch
+
+    @property
+    def precision(self):
+        return int(np.log2(len(self.registers)))
+
+    @property
+    def error(self):
+        """Relative standard error of count()"""
+        return 1.04 / np.sqrt(len(self.registers))
+
+    def add(self, keys):
+        if not len(keys):
+            return
+        p = self.precision
+        hashes = _hash(keys)
+        bucket = (hashes >> np.uint64(64 - p)).astype(np.int64)
+        rest = hashes & np.uint64((1 << (64 - p)) - 1)
+        # Position of the first 1 bit in the remaining 64 - p bits
+        rank = (64 - p + 1 - _bit_length(rest)).astype(np.uint8)
+        np.maximum.at(self.registers, bucket, rank)
+
+    def merge(self, other):
+        """Sketch of the union of both key sets"""
+        return HyperLogLog(np.maximum(self.registers, other.registers))
+
+    def count(self):
+        m = len(self.registers)
+        estimate = 0.7213 / (1 + 1.079 / m) * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            # Linear counting is more accurate for small sets
+            estimate = m * np.log(m / zeros)
+        return int(round(estimate))
+
+
+class QuantileSketch:
+    """Quantiles of positive values to within a relative error ``alpha``
+    (DDSketch); values <= 0 are kept in one bucket at the minimum"""
+
+    def __init__(self, alpha=QUANTILE_ERROR):
+        self.alpha = alpha
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self.buckets = np.empty(0, dtype=np.int64)
+        self.counts = np.empty(0, dtype=np.int64)
+        self.zeros = 0
+        self.min = np.inf
+        self.max = -np.inf
+
+    @classmethod
+    def of(cls, values, alpha=QUANTILE_ERROR):
+        sketch = cls(alpha)
+        sketch.add(values)
+        return sketch
+
+    def __len__(self):
+        return int(self.counts.sum()) + self.zeros
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        positive = values[values > 0]
+        self.zeros += len(values) - len(positive)
+        buckets = np.ceil(np.log(positive) / np.log(self.gamma)).astype(np.int64)
+        self._add_counts(*np.unique(buckets, return_counts=True))
+
+    def _add_counts(self, buckets, counts):
+        buckets, inverse = np.unique(np.concatenate([self.buckets, buckets]), return_inverse=True)
+        self.counts = np.bincount(inverse, weights=np.concatenate([self.counts, counts]),
+                                  minlength=len(buckets)).astype(np.int64)
+        self.buckets = buckets
+
+    def merge(self, other):
+        """Sketch of both value sets; both must share ``alpha``"""
+        merged = QuantileSketch(self.alpha)
+        merged.buckets, merged.counts = self.buckets, self.counts
+        merged._add_counts(other.buckets, other.counts)
+        merged.zeros = self.zeros + other.zeros
+        merged.min, merged.max = min(self.min, other.min), max(self.max, other.max)
+        return merged
+
+    def quantile(self, qs):
+        """Estimates of the ``qs`` quantiles; 0 and 1 give the exact min and max"""
+        qs = np.atleast_1d(np.asarray(qs, dtype=np.float64))
+        n = len(self)
+        if not n:
+            return np.full(len(qs), np.nan)
+        ranks = qs * (n - 1)
+        # Bucket i holds values in (gamma**(i-1), gamma**i]; its estimate is within alpha of both
+        values = 2 * self.gamma ** self.buckets / (self.gamma + 1)
+        cumulative = self.zeros + np.cumsum(self.counts)
+        pos = np.minimum(np.searchsorted(cumulative, ranks, side="right"), len(values) - 1)
+        estimates = np.where(ranks < self.zeros, self.min, values[pos] if len(values) else self.min)
+        estimates = np.clip(estimates, self.min, self.max)
+        estimates[qs <= 0] = self.min
+        estimates[qs >= 1] = self.max
+        return estimates
@@ -0,0 +1,250 @@
+"""Delivery SLA engine: delay-day histograms of delivered items.
+
+Delay is delivery time minus estimated delivery time in whole days
+(negative: delivered early), the quantity is_delayed thresholds at zero.
+build_histograms counts delivered items per (customer state, seller state,
+purchase month, category, delay day, review score) once, and the
+histograms are kept as a model artifact; a slice of any of those
+dimensions, an on-time rate, a delay percentile or a delay-vs-review
+breakdown is then a bincount over the stored counts instead of a scan of
+the fact rows. Percentiles are exact to the day, except that delays beyond
+MIN_DELAY and MAX_DELAY are clipped into the end bins; every bin also sums
+its items' unclipped delays, so mean delays are exact.
+"""
+import numpy as np
+import pandas as pd
+
+# Delay days below/above are counted in the first/last bin
+MIN_DELAY = -60
+MAX_DELAY = 90
+
+DELAYS = np.arange(MIN_DELAY, MAX_DELAY + 1)
+
+# Review score bins: 0 for items without a review, then 1-5
+REVIEWS = np.arange(6)
+
+# Delay buckets of the delay-vs-review breakdown (upper edges, in days)
+DELAY_BUCKETS = {
+    "2+ weeks early": -14,
+    "1-2 weeks early": -7,
+    "0-6 days early": 0,
+    "1-3 days late": 3,
+    "4-7 days late": 7,
+    "8-14 days late": 14,
+    "15+ days late": MAX_DELAY,
+}
+
+# Cell dimensions: source column -> histogram column
+DIMENSIONS = {
+    "customer_state": "customer_state",
+    "seller_state": "seller_state",
+    "product_category_name_english": "category",
+}
+
+# Columns build_histograms selects from the model
+SOURCE_COLS = list(DIMENSIONS) + ["order_purchase_timestamp", "delivery_time", "estimated_time",
+                                  "review_score"]
+
+# Narrow dtype of each stored column
+BIN_DTYPES = {"customer_state": "int16", "seller_state": "int16", "category": "int16",
+              "month": "int32", "delay": "int16", "review": "int8", "items": "int64",
+              "delay_days": "int64"}
+
+# Additive values of each bin: item count and the items' unclipped delays summed
+VALUES = ["items", "delay_days"]
+
+
+def _fold(columns, values):
+    """Each of ``values`` (VALUES name -> array) summed per distinct row of
+    the integer ``columns``, sorted"""
+    names = list(columns)
+    n = len(values["items"])
+    if not n:
+        return pd.DataFrame({name: np.empty(0, dtype=BIN_DTYPES[name]) for name in names + VALUES})
+    # Mixed-radix code of each row, so a single sort groups equal rows
+    lows = {name: int(columns[name].min()) for name in names}
+    sizes = {name: int(columns[name].max()) - lows[name] + 1 for name in names}
+    code = np.zeros(n, dtype=np.int64)
+    for name in names:
+        code = code * sizes[name] + (columns[name].astype(np.int64) - lows[name])
+    keys, inverse = np.unique(code, return_inverse=True)
+    sums = {value: np.bincount(inverse, weights=values[value], minlength=len(keys)).round().astype(np.int64)
+            for value in VALUES}
+    data = {}
+    for name in reversed(names):
+        keys, digit = np.divmod(keys, sizes[name])
+        data[name] = (digit + lows[name]).astype(BIN_DTYPES[name])
+    data = {name: data[name] for name in names}
+    data.update(sums)
+    out = pd.DataFrame(data)
+    # Bins an update cancelled out hold nothing
+    return out[out["items"] != 0].reset_index(drop=True)
+
+
+def _month_code(value):
+    """Months since 1970-01 of a timestamp (a monthly Period's ordinal)"""
+    return pd.Timestamp(value).to_period("M").ordinal
+
+
+def month_label(codes):
+    return pd.PeriodIndex.from_ordinals(np.asarray(codes, dtype=np.int64), freq="M").strftime("%Y-%m")
+
+
+class DelayHistograms:
+    """Delay-day x review-score counts of delivered items per (customer
+    state, seller state, purchase month, category) cell.
+
+    Only bins holding items are stored: ``bins`` has one row per cell,
+    delay day and review score with narrow integer codes, the item count
+    and the items' unclipped delays summed.
+    ``levels`` holds the labels behind each dimension's codes (-1 is
+    missing); month codes are months since 1970-01. Counts are additive, so
+    histograms of two sets of fact rows combine like cube.Cube.
+    """
+
+    def __init__(self, bins, levels):
+        self.bins = bins
+        self.levels = levels
+
+    def __len__(self):
+        return int(self.bins["items"].sum())
+
+    def _mask(self, where=None, start=None, end=None):
+        """Bins in the cells of ``where`` (dimension -> label or labels),
+        purchased in the months [start, end)"""
+        mask = np.ones(len(self.bins), dtype=bool)
+        for dim, value in (where or {}).items():
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            codes = self.levels[dim].get_indexer(list(values))
+            mask &= np.isin(self.bins[dim].to_numpy(), codes[codes >= 0])
+        month = self.bins["month"].to_numpy()
+        if start is not None:
+            mask &= month >= _month_code(start)
+        if end is not None:
+            mask &= month < _month_code(end)
+        return mask
+
+    def select(self, where=None, start=None, end=None):
+        """The bins in the cells of ``where`` purchased in the months [start,
+        end) (first days of months)"""
+        if not where and start is None and end is None:
+            return self
+        bins = self.bins[self._mask(where, start, end)].reset_index(drop=True)
+        return DelayHistograms(bins, self.levels)
+
+    def counts(self, by=None, where=None, start=None, end=None, reviews=False, value="items"):
+        """Summed histograms: items per delay day (per review score too with
+        ``reviews``), per value of dimension ``by`` if given. ``value``
+        "delay_days" sums the items' unclipped delays instead.
+
+        Returns an array of shape ([values of ``by``,] delay days[, review
+        scores]) and the labels of its first axis (None without ``by``).
+        """
+        bins = self.select(where, start, end).bins
+        cell = (bins["delay"].to_numpy(dtype=np.int64) - MIN_DELAY) * len(REVIEWS)
+        cell += bins["review"].to_numpy(dtype=np.int64)
+        shape = (len(DELAYS), len(REVIEWS))
+        labels = None
+        if by is not None:
+            codes = bins[by].to_numpy(dtype=np.int64)
+            if by == "month":
+                lo = int(codes.min()) if len(codes) else 0
+                labels = month_label(np.arange(lo, int(codes.max()) + 1 if len(codes) else lo))
+                codes = codes - lo
+            else:
+                # Missing labels (-1) go last
+                labels = self.levels[by].append(pd.Index([None]))
+                codes = np.where(codes < 0, len(labels) - 1, codes)
+            cell += codes * (shape[0] * shape[1])
+            shape = (len(labels),) + shape
+        counts = np.bincount(cell, weights=bins[value].to_numpy(),
+                             minlength=int(np.prod(shape))).round().astype(np.int64).reshape(shape)
+        return (counts if reviews else counts.sum(axis=-1)), labels
+
+    def combine(self, other, sign=1, fold=True):
+        """These histograms plus ``sign`` times ``other``'s.
+
+        With ``fold`` False the bins are only concatenated, which counts sums
+        all the same: cheaper for histograms of disjoint months that are
+        summed once rather than stored.
+        """
+        levels, columns = {}, {}
+        for dim in DIMENSIONS.values():
+            levels[dim] = self.levels[dim].append(
+                other.levels[dim][~other.levels[dim].isin(self.levels[dim])])
+            # Recode other's bins to the merged labels
+            recode = np.append(levels[dim].get_indexer(other.levels[dim]), -1)
+            columns[dim] = np.concatenate([self.bins[dim].to_numpy(),
+                                           recode[other.bins[dim].to_numpy()]])
+        for col in ["month", "delay", "review"]:
+            columns[col] = np.concatenate([self.bins[col].to_numpy(), other.bins[col].to_numpy()])
+        values = {value: np.concatenate([self.bins[value].to_numpy(), sign * other.bins[value].to_numpy()])
+                  for value in VALUES}
+        ordered = {col: columns[col] for col in self.bins.columns if col not in VALUES}
+        if not fold:
+            bins = pd.DataFrame({col: data.astype(BIN_DTYPES[col]) for col, data in ordered.items()})
+            for value in VALUES:
+                bins[value] = values[value]
+            return DelayHistograms(bins, levels)
+        return DelayHistograms(_fold(ordered, {value: data.astype(np.float64)
+                                               for value, data in values.items()}), levels)
+
+
+def build_histograms(model, rows=None):
+    """DelayHistograms of the model's delivered fact rows (``rows`` only,
+    if given, as in cube.build_cube)"""
+    df = model.select(SOURCE_COLS, rows)
+    delay = (df["delivery_time"] - df["estimated_time"]).to_numpy(dtype=np.float64, na_value=np.nan)
+    delivered = ~np.isnan(delay) & df["order_purchase_timestamp"].notna().to_numpy()
+    df = df[delivered]
+    # Whole days already; clipping puts the tails in the end bins
+    delay = delay[delivered]
+    # A "mean" review policy leaves fractional scores; they count at the nearest one
+    review = df["review_score"].to_numpy(dtype=np.float64, na_value=0).round()
+    columns, levels = {}, {}
+    for source, dim in DIMENSIONS.items():
+        values = df[source]
+        levels[dim] = pd.Index(values.cat.categories)
+        columns[dim] = values.cat.codes.to_numpy()
+    columns["month"] = df["order_purchase_timestamp"].to_numpy().astype("datetime64[M]").astype(np.int64)
+    columns["delay"] = np.clip(delay, MIN_DELAY, MAX_DELAY).astype(np.int64)
+    columns["review"] = review.astype(np.int64)
+    return DelayHistograms(_fold(columns, {"items": np.ones(len(df)), "delay_days": delay}), levels)
+
+
+def summarize(counts, delay_days, labels=None, name=None):
+    """Delivered items, on-time rate (%), mean delay and delay percentiles
+    of histograms ``counts`` (delay days on the last axis), one row per
+    label; the mean is taken from the summed unclipped ``delay_days``"""
+    counts = np.atleast_2d(counts)
+    delay_days = np.atleast_2d(delay_days)
+    items = counts.sum(axis=-1)
+    cumulative = counts.cumsum(axis=-1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        summary = {
+            "Delivered": items,
+            "On_Time_%": counts[:, DELAYS <= 0].sum(axis=-1) / items * 100,
+            "Avg_Delay": delay_days.sum(axis=-1) / items,
+        }
+    for q in [50, 90, 95]:
+        # Smallest delay with at least q% of the items at or below it
+        position = (cumulative < np.ceil(items * q / 100)[:, None]).sum(axis=-1)
+        summary[f"P{q}_Delay"] = np.where(items > 0, DELAYS[np.minimum(position, len(DELAYS) - 1)], np.nan)
+    df = pd.DataFrame(summary)
+    if labels is not None:
+        df.insert(0, name, labels)
+    return df
+
+
+def delay_reviews(counts):
+    """Items, reviews and average review per DELAY_BUCKETS bucket of a delay
+    x review-score histogram"""
+    edges = np.array(list(DELAY_BUCKETS.values()))
+    bucket = np.searchsorted(edges, DELAYS)
+    per_bucket = np.zeros((len(edges), len(REVIEWS)), dtype=np.int64)
+    np.add.at(per_bucket, bucket, counts)
+    reviews = per_bucket[:, 1:].sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        average = (per_bucket[:, 1:] * REVIEWS[1:]).sum(axis=1) / reviews
+    return pd.DataFrame({"Delay": list(DELAY_BUCKETS), "Items": per_bucket.sum(axis=1),
+                         "Reviews": reviews, "Avg_Review": average})
@@ -0,0 +1,450 @@
+"""Star-schema model: a slim order-items fact table plus dimension tables"""
+import os
+from collections import ChainMap
+
+import numpy as np
+import pandas as pd
+
+import compact
+
+# Fact column that points into each dimension table
+DIMENSION_KEYS = {
+    "orders": "order_key",
+    "customers": "customer_key",
+    "products": "product_key",
+    "sellers": "seller_key",
+    "dates": "date_key",
+}
+
+# Natural ID of each dimension; selected as a categorical over the key
+DIMENSION_IDS = {
+    "orders": "order_id",
+    "customers": "customer_id",
+    "products": "product_id",
+    "sellers": "seller_id",
+}
+
+# Order-level attributes carried on the fact table as degenerate dimensions
+ORDER_MEASURES = ["order_status", "order_purchase_timestamp", "delivery_time",
+                  "estimated_time", "is_delayed"]
+
+# Columns of the orders dimension; it keeps the full order record so that an
+# order's fact rows can be rebuilt when an incremental drop touches it
+ORDER_COLUMNS = ["order_id", "customer_key", "date_key"] + ORDER_MEASURES + [
+    "order_approved_at", "order_delivered_carrier_date",
+    "order_delivered_customer_date", "order_estimated_delivery_date"]
+
+# Encoded order items, the input of assemble_fact()
+ITEM_COLUMNS = ["order_key", "product_key", "seller_key", "order_item_id",
+                "price", "freight_value"]
+
+# Review records kept next to the fact; review_score is joined onto it
+REVIEW_COLUMNS = ["review_id", "order_key", "review_score", "review_creation_date"]
+
+# How an order's review records collapse to the one score on its fact rows
+# (override with DASHBOARD_REVIEW_POLICY); see order_reviews()
+REVIEW_POLICIES = ["latest", "mean", "min"]
+REVIEW_POLICY = os.environ.get("DASHBOARD_REVIEW_POLICY", "latest")
+
+TABLES = ["fact"] + list(DIMENSION_KEYS) + ["reviews"]
+
+
+class StarSchema:
+    """Fact table of integer keys and measures with its dimension tables"""
+
+    def __init__(self, fact, orders, customers, products, sellers, dates, reviews, key=None):
+        tables = {"fact": fact, "orders": orders, "customers": customers, "products": products,
+                  "sellers": sellers, "dates": dates, "reviews": reviews}
+        self._setup(tables, {name: list(df.columns) for name, df in tables.items()}, key)
+
+    @classmethod
+    def from_tables(cls, tables, columns, key=None):
+        """Model over a mapping of table name -> DataFrame.
+
+        ``tables`` may load each table on first access (see ingest.LazyMapping);
+        ``columns`` lists every table's columns, so resolving a column's
+        owner in select() reads nothing.
+        """
+        model = cls.__new__(cls)
+        model._setup(tables, columns, key)
+        return model
+
+    def _setup(self, tables, columns, key):
+        self._tables = tables
+        self._columns = {name: list(cols) for name, cols in columns.items()}
+        self._fact_columns = self._columns["fact"]
+        # Identifies the source snapshot; used to key derived caches
+        self.key = key
+        # Derived aggregates kept in step with the tables (see incremental.py)
+        self.artifacts = {}
+        # Watermark and drop files applied on top of the source CSVs
+        self.increments = {"watermark": None, "files": {}}
+        self._owner = {}
+        for table in DIMENSION_KEYS:
+            for col in columns[table]:
+                self._owner.setdefault(col, table)
+
+    @property
+    def fact(self):
+        return self._tables["fact"]
+
+    @property
+    def reviews(self):
+        return self._tables["reviews"]
+
+    @property
+    def dimensions(self):
+        return {name: self._tables[name] for name in DIMENSION_KEYS}
+
+    @property
+    def tables(self):
+        return {name: self._tables[name] for name in TABLES}
+
+    @property
+    def source(self):
+        """The mapping the tables come from, e.g. ingest.SnapshotTables"""
+        return self._tables
+
+    def table_columns(self):
+        """Columns of every table, without reading any"""
+        return {name: list(cols) for name, cols in self._columns.items()}
+
+    def __getitem__(self, table):
+        return self._tables[table]
+
+    def window(self, start=None, end=None):
+        """Fact rows purchased in [``start``, ``end``) as a positional slice.
+
+        The fact table is kept in purchase-time order, so this is two binary
+        searches and ``fact.iloc[window]`` is a view; None leaves a side open.
+        """
+        times, unit = time_key(self.fact)
+        lo = 0 if start is None else int(np.searchsorted(times, _ticks(start, unit)))
+        hi = len(times) if end is None else int(np.searchsorted(times, _ticks(end, unit)))
+        return slice(lo, max(lo, hi))
+
+    def fact_columns(self, columns):
+        """Fact columns select(``columns``) reads: the fact's own columns and
+        the dimension keys of the rest"""
+        needed = [col if col in self._fact_columns else DIMENSION_KEYS[self._owner[col]]
+                  for col in columns]
+        return list(dict.fromkeys(needed))
+
+    def fact_size(self):
+        """Fact rows, without reading a partitioned fact table that is not loaded"""
+        size = getattr(self._tables, "fact_size", None)
+        if size is not None and "fact" not in self._tables.loaded():
+            return size()
+        return len(self.fact)
+
+    def prune(self, start=None, end=None, columns=None):
+        """Model over only the fact partitions that can hold purchases in [``start``, ``end``).
+
+        Applies to a model opened lazily from the snapshot, whose fact table is
+        stored as year/month partitions (see ingest.SnapshotTables): only those
+        partitions, and of them only ``columns`` plus the purchase time (None
+        for all), are read. Dimensions and reviews are shared with this model;
+        artifacts are not, as they cover the whole history. A model whose fact
+        table is already in memory is returned as it is, since window() slices
+        it for free.
+        """
+        read_fact = getattr(self._tables, "read_fact", None)
+        if read_fact is None or "fact" in self._tables.loaded():
+            return self
+        if columns is not None:
+            columns = list(dict.fromkeys(["order_purchase_timestamp"] + list(columns)))
+        fact = read_fact(start, end, columns)
+        tables = ChainMap({"fact": fact}, self._tables)
+        model = StarSchema.from_tables(tables, dict(self._columns, fact=list(fact.columns)), self.key)
+        model.increments = self.increments
+        return model
+
+    def sketches(self, start, end):
+        """Distinct-count sketches merged over the fact partitions of the
+        months in [``start``, ``end``) and those months (see
+        ingest.SnapshotTables.read_sketches); None when the fact table is not
+        stored in partitions"""
+        read_sketches = getattr(self._tables, "read_sketches", None)
+        return None if read_sketches is None else read_sketches(start, end)
+
+    def memory_usage(self):
+        """Deep memory usage in bytes of every table"""
+        return pd.Series({name: df.memory_usage(index=False, deep=True).sum()
+                          for name, df in self.tables.items()})
+
+    def select(self, columns, rows=None):
+        """Fact rows with only ``columns`` joined in from their dimensions.
+
+        ``rows`` optionally restricts the result to a positional slice or
+        index array of the fact table.
+        """
+        fact = self.fact if rows is None else self.fact.iloc[rows]
+        data = {}
+        for col in columns:
+            if col in self._fact_columns:
+                data[col] = fact[col].array
+                continue
+            table = self._owner.get(col)
+            if table is None:
+                raise KeyError(col)
+            dim = self._tables[table]
+            keys = fact[DIMENSION_KEYS[table]].to_numpy()
+            if col == DIMENSION_IDS.get(table):
+                data[col] = pd.Categorical.from_codes(keys, categories=pd.Index(dim[col]))
+            else:
+                data[col] = dim[col].array.take(keys)
+        return pd.DataFrame(data)
+
+
+def _dimension(table, id_col, extra_ids=None):
+    """Deduplicate ``table`` on its ID so that row position is the key.
+
+    IDs in ``extra_ids`` missing from the table get a row of NaNs.
+    """
+    table = table.drop_duplicates(subset=id_col).reset_index(drop=True)
+    if extra_ids is not None:
+        codec = compact.IdCodec(pd.concat([table[id_col], pd.Series(extra_ids)]))
+        if len(codec) > len(table):
+            table = table.set_index(id_col).reindex(codec.index).rename_axis(id_col).reset_index()
+    return table, compact.IdCodec(table[id_col])
+
+
+def time_key(frame, column="order_purchase_timestamp", unit=None):
+    """Ticks of a datetime column as int64 (NaT first) and their unit, the
+    fact table's sort key; a view unless ``unit`` asks for a conversion"""
+    times = frame[column].to_numpy()
+    if unit is not None:
+        times = times.astype(f"datetime64[{unit}]")
+    return times.view("int64"), np.datetime_data(times.dtype)[0]
+
+
+def _ticks(value, unit):
+    return np.datetime64(pd.Timestamp(value).to_datetime64(), unit).astype(np.int64)
+
+
+def merge_sorted(fact, rows):
+    """``rows`` inserted into ``fact``, both in purchase-time order.
+
+    Returns the merged table and the positions the rows landed at; rows
+    go after existing rows with the same purchase time.
+    """
+    times, unit = time_key(fact)
+    positions = np.searchsorted(times, time_key(rows, unit=unit)[0], side="right") + np.arange(len(rows))
+    is_new = np.zeros(len(fact) + len(rows), dtype=bool)
+    is_new[positions] = True
+    take = np.empty(len(is_new), dtype=np.int64)
+    take[~is_new] = np.arange(len(fact))
+    take[is_new] = len(fact) + np.arange(len(rows))
+    return append_rows(fact, rows).iloc[take].reset_index(drop=True), positions
+
+
+def append_rows(df, rows):
+    """``df`` followed by ``rows``, keeping ``df``'s column dtypes.
+
+    Categorical columns grow their categories instead of falling back to
+    strings, so frames built from different drops concatenate cleanly.
+    """
+    rows = rows.reindex(columns=df.columns)
+    left, right = {}, {}
+    for col in df.columns:
+        dtype = df[col].dtype
+        if not isinstance(dtype, pd.CategoricalDtype):
+            continue
+        values = pd.Index(pd.unique(np.asarray(rows[col], dtype=object))).dropna()
+        extra = values[~values.isin(dtype.categories)]
+        categories = dtype.categories.append(extra) if len(extra) else dtype.categories
+        left[col] = df[col].cat.set_categories(categories) if len(extra) else df[col]
+        right[col] = pd.Categorical(np.asarray(rows[col], dtype=object), categories=categories)
+    out = pd.concat([df.assign(**left), rows.assign(**right)], ignore_index=True)
+    for col in df.columns:
+        # Not categoricals: casting back to the old categories would null the new values
+        if col not in left and out[col].dtype != df[col].dtype:
+            try:
+                out[col] = out[col].astype(df[col].dtype)
+            except (TypeError, ValueError):
+                pass
+    return out
+
+
+def upsert_dimension(dim, id_col, rows):
+    """Replace the rows of ``dim`` whose ID appears in ``rows`` and append the rest.
+
+    Existing keys keep their position. Returns the new table and the key of
+    every row of ``rows``.
+    """
+    rows = rows.drop_duplicates(subset=id_col, keep="last").reset_index(drop=True)
+    keys = compact.IdCodec.from_unique(dim[id_col]).encode(rows[id_col])
+    known = keys >= 0
+    new = np.flatnonzero(~known)
+    order = np.arange(len(dim))
+    order[keys[known]] = len(dim) + np.flatnonzero(known)
+    order = np.concatenate([order, len(dim) + new])
+    keys[new] = len(dim) + np.arange(len(new), dtype=np.int32)
+    table = append_rows(dim, rows).take(order).reset_index(drop=True)
+    return table, keys
+
+
+def build_dates(timestamps, dates=None):
+    """Calendar dimension covering every purchase day; key = days since the first.
+
+    When an existing ``dates`` table is given the calendar is widened to
+    cover both; returns the calendar, the key of each timestamp and how many
+    days the existing keys shift by.
+    """
+    days = timestamps.dt.normalize()
+    bounds = days if dates is None else pd.concat([days, dates["order_date"].iloc[[0, -1]]])
+    calendar = pd.date_range(bounds.min(), bounds.max(), freq="D")
+    dates_table = pd.DataFrame({
+        "order_date": calendar,
+        "order_year": calendar.year.astype("int16"),
+        "order_month": calendar.month.astype("int8"),
+        "order_quarter": calendar.quarter.astype("int8"),
+        "order_weekday": calendar.weekday.astype("int8"),
+    })
+    keys = ((days - calendar[0]) // pd.Timedelta(days=1)).astype("int32")
+    shift = 0 if dates is None else (dates["order_date"].iloc[0] - calendar[0]).days
+    return dates_table, keys.to_numpy(), shift
+
+
+def encode_items(order_items, order_codec, product_codec, seller_codec):
+    """Order items with their IDs replaced by dimension keys (ITEM_COLUMNS)"""
+    return pd.DataFrame({
+        "order_key": order_codec.encode(order_items["order_id"]),
+        "product_key": product_codec.encode(order_items["product_id"]),
+        "seller_key": seller_codec.encode(order_items["seller_id"]),
+        "order_item_id": order_items["order_item_id"].to_numpy(),
+        "price": order_items["price"].to_numpy(),
+        "freight_value": order_items["freight_value"].to_numpy(),
+    })
+
+
+def encode_reviews(reviews, order_codec):
+    """Review records of known orders (REVIEW_COLUMNS)"""
+    df = pd.DataFrame({
+        "review_id": reviews["review_id"].to_numpy(),
+        "order_key": order_codec.encode(reviews["order_id"]),
+        "review_score": reviews["review_score"].to_numpy(),
+        "review_creation_date": reviews["review_creation_date"].to_numpy(),
+    })
+    return compact.compact_frame(df[df["order_key"] >= 0].reset_index(drop=True))
+
+
+def order_reviews(reviews, key="order_key", policy=None):
+    """One review score per order from its review records.
+
+    "latest" keeps the most recently created review (the later record on
+    a tie), "mean" averages the scores and "min" keeps the lowest. Returns
+    ``key`` and review_score, one row per reviewed order; "mean" scores are
+    Float32, the others keep the records' dtype.
+    """
+    policy = policy or REVIEW_POLICY
+    if policy not in REVIEW_POLICIES:
+        raise ValueError(f"Unknown review policy {policy!r}; expected one of {REVIEW_POLICIES}")
+    if policy == "latest":
+        latest = reviews.sort_values("review_creation_date", kind="stable", na_position="first")
+        return latest.drop_duplicates(key, keep="last")[[key, "review_score"]].reset_index(drop=True)
+    scores = reviews.groupby(key, as_index=False, sort=False)["review_score"].agg(policy)
+    if policy == "mean":
+        scores["review_score"] = scores["review_score"].astype("Float32")
+    return scores
+
+
+def assemble_fact(orders, items, reviews, policy=None):
+    """Fact rows for encoded ``items`` joined with their order and reviews.
+
+    Items need a known order, product and customer (inner-join semantics);
+    rows come out in purchase-time order, each order's items together and in
+    their original order, so a date window is a slice (see
+    StarSchema.window). Reviews are
+    collapsed to one per order first (see order_reviews), so an order with
+    several review records keeps one fact row per item.
+    """
+    items = items[(items["order_key"] >= 0) & (items["product_key"] >= 0)]
+    scores = order_reviews(reviews, policy=policy)
+    if len(scores) > len(orders) or (len(scores) and scores["order_key"].max() >= len(orders)):
+        raise ValueError(f"{len(scores):,} reviewed orders do not fit {len(orders):,} orders")
+    n_items = len(items)
+    items = items.merge(scores, on="order_key", how="left")
+    if len(items) != n_items:
+        raise ValueError("Review join changed the number of order item rows")
+    order_key = items["order_key"].to_numpy()
+    customer_key = orders["customer_key"].to_numpy()[order_key]
+
+    rows = np.flatnonzero(customer_key >= 0)
+    times = time_key(orders)[0]
+    rows = rows[np.lexsort((order_key[rows], times[order_key[rows]]))]
+    order_key = order_key[rows]
+
+    fact = pd.DataFrame({
+        "order_key": order_key,
+        "customer_key": customer_key[rows],
+        "product_key": items["product_key"].to_numpy()[rows],
+        "seller_key": items["seller_key"].to_numpy()[rows],
+        "date_key": orders["date_key"].to_numpy()[order_key],
+        "order_item_id": items["order_item_id"].to_numpy()[rows],
+    })
+    for col in ORDER_MEASURES:
+        fact[col] = orders[col].array.take(order_key)
+    fact["price"] = items["price"].to_numpy()[rows]
+    fact["freight_value"] = items["freight_value"].to_numpy()[rows]
+    fact = compact.compact_frame(fact)
+    # After compaction: "mean" scores are not whole
+    fact["review_score"] = items["review_score"].array.take(rows)
+    return fact
+
+
+def build_dimensions(orders, products, customers, sellers, reviews, seller_ids=None):
+    """Dimension tables, encoded reviews and the codecs order items are encoded with.
+
+    ``seller_ids`` are the sellers referenced by the items; unknown ones get
+    a row of NaNs so that every item keeps its seller.
+    """
+    orders, order_codec = _dimension(orders, "order_id")
+    products, product_codec = _dimension(products, "product_id")
+    customers, customer_codec = _dimension(customers, "customer_id")
+    sellers, seller_codec = _dimension(sellers, "seller_id", seller_ids)
+
+    dates, date_keys, _ = build_dates(orders["order_purchase_timestamp"])
+    orders["customer_key"] = customer_codec.encode(orders["customer_id"])
+    orders["date_key"] = date_keys
+    orders = compact.compact_frame(orders[ORDER_COLUMNS])
+
+    codecs = {"customer_unique_id": compact.IdCodec(customers["customer_unique_id"])}
+    dimensions = {
+        "orders": orders,
+        "customers": compact.compact_frame(customers, codecs),
+        "products": compact.compact_frame(products),
+        "sellers": compact.compact_frame(sellers),
+        "dates": dates,
+    }
+    item_codecs = {"order_id": order_codec, "product_id": product_codec, "seller_id": seller_codec}
+    return dimensions, encode_reviews(reviews, order_codec), item_codecs
+
+
+def build_star(orders, order_items, products, customers, sellers, reviews):
+    """Build the star schema from prepared orders/products and raw tables"""
+    dimensions, reviews, codecs = build_dimensions(orders, products, customers, sellers, reviews,
+                                                   order_items["seller_id"])
+    items = encode_items(order_items, codecs["order_id"], codecs["product_id"], codecs["seller_id"])
+    return StarSchema(fact=assemble_fact(dimensions["orders"], items, reviews),
+                      reviews=reviews, **dimensions)
+
+
+if __name__ == "__main__":
+    import sys
+
+    import ingest
+
+    path = sys.argv[1] if len(sys.argv) > 1 else ingest.find_data_path()
+    if path is None:
+        sys.exit("orders_dataset.csv not found")
+    tables = ingest.read_tables(path)
+    source = pd.Series({name: df.memory_usage(index=False, deep=True).sum()
+                        for name, df in tables.items()})
+    model = ingest.build_model(tables)
+    usage = model.memory_usage()
+    for name, df in model.tables.items():
+        columns = df.memory_usage(index=False, deep=True)
+        print(f"{name}: {usage[name] / 1e6:,.2f} MB, {len(df):,} rows")
+        print((columns / 1e6).round(2).to_string())
+    print(f"star total {usage.sum() / 1e6:,.1f} MB vs source tables {source.sum() / 1e6:,.1f} MB")
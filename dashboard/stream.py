@@ -0,0 +1,119 @@
+"""Out-of-core reading of the order and item CSVs for histories larger than RAM.
+
+The in-memory build materializes the whole fact table. The streaming build
+instead reads the orders CSV in chunks into the compact orders dimension,
+then reads the order items in chunks and turns each chunk into a small fact
+table against the in-memory dimensions (orders, customers, products with
+their category, sellers, dates and reviews). Every chunk is a StarSchema of
+its own, so the artifact builders (cube, RFM inputs, product and geo totals)
+run on it unchanged and their partial results are folded together (see
+incremental.build_streaming). Memory is bounded by the dimensions plus one
+chunk; the fact table is never held as a whole.
+
+Distinct order counts only add up across chunks when an order's items sit
+in one chunk. Chunks are cut at order boundaries, which requires the item
+rows to be grouped by order as in the Olist export; an order whose items
+reappear after its chunk was folded raises ValueError.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+import ingest
+import schema
+import star
+
+# Rows per CSV chunk (override with DASHBOARD_CHUNK_ROWS)
+CHUNK_ROWS = int(os.environ.get("DASHBOARD_CHUNK_ROWS", 500_000))
+
+# Raw order columns kept while reading; the keys are added by build_dimensions
+ORDER_READ_COLUMNS = ["order_id", "customer_id"] + [
+    col for col in star.ORDER_COLUMNS if col not in ("order_id", "customer_key", "date_key")]
+
+
+def _csv(data_path, name):
+    return os.path.join(data_path, ingest.DATA_FILES[name])
+
+
+def read_orders(data_path, chunk_rows=CHUNK_ROWS):
+    """Prepared orders, parsed chunk by chunk so the raw text is never held whole"""
+    parts = []
+    for chunk in schema.read_csv(_csv(data_path, "orders"), "orders", chunksize=chunk_rows):
+        parts.append(ingest.prepare_orders(chunk)[ORDER_READ_COLUMNS])
+    return pd.concat(parts, ignore_index=True)
+
+
+def item_sellers(data_path, chunk_rows=CHUNK_ROWS):
+    """Distinct seller IDs referenced by the order items, in order of appearance"""
+    ids = [pd.unique(chunk["seller_id"])
+           for chunk in schema.read_csv(_csv(data_path, "order_items"), "order_items",
+                                        usecols=["seller_id"], chunksize=chunk_rows)]
+    return pd.unique(np.concatenate(ids)) if ids else np.array([], dtype=object)
+
+
+def read_dimensions(data_path, chunk_rows=CHUNK_ROWS):
+    """Dimension tables, encoded reviews and item codecs, as in star.build_dimensions"""
+    # Review comments are the bulk of the reviews file and are never used
+    tables = schema.read_tables(
+        data_path, {name: ingest.DATA_FILES[name]
+                    for name in ["products", "category", "customers", "sellers", "reviews"]},
+        usecols={"reviews": ["review_id", "order_id", "review_score", "review_creation_date"]})
+    return star.build_dimensions(
+        orders=read_orders(data_path, chunk_rows),
+        products=ingest.prepare_products(tables["products"], tables["category"]),
+        customers=tables["customers"],
+        sellers=tables["sellers"],
+        reviews=tables["reviews"],
+        seller_ids=item_sellers(data_path, chunk_rows),
+    )
+
+
+def item_chunks(data_path, chunk_rows=CHUNK_ROWS):
+    """Order item rows in chunks of about ``chunk_rows``, cut between orders.
+
+    The trailing order of each chunk is held back and prepended to the next,
+    so an order split by the CSV chunking stays whole.
+    """
+    carry = None
+    for chunk in schema.read_csv(_csv(data_path, "order_items"), "order_items", chunksize=chunk_rows):
+        if carry is not None:
+            chunk = pd.concat([carry, chunk], ignore_index=True)
+        ids = chunk["order_id"].to_numpy()
+        breaks = np.flatnonzero(ids[1:] != ids[:-1])
+        if not len(breaks):
+            carry = chunk
+            continue
+        cut = breaks[-1] + 1
+        carry = chunk.iloc[cut:]
+        yield chunk.iloc[:cut]
+    if carry is not None and len(carry):
+        yield carry
+
+
+def fact_chunks(data_path, chunk_rows=CHUNK_ROWS):
+    """The model as a sequence of StarSchemas sharing the dimensions, one per item chunk.
+
+    Yields at least one (possibly empty) chunk so the caller always gets
+    the dimensions and the fact columns.
+    """
+    dimensions, reviews, codecs = read_dimensions(data_path, chunk_rows)
+    folded = np.zeros(len(dimensions["orders"]), dtype=bool)
+    empty = True
+    for items in item_chunks(data_path, chunk_rows):
+        encoded = star.encode_items(items, codecs["order_id"], codecs["product_id"],
+                                    codecs["seller_id"])
+        fact = star.assemble_fact(dimensions["orders"], encoded, reviews)
+        order_keys = np.unique(fact["order_key"].to_numpy())
+        if folded[order_keys].any():
+            raise ValueError(f"{ingest.DATA_FILES['order_items']} is not grouped by order_id; "
+                             "sort it by order_id or use the in-memory build")
+        folded[order_keys] = True
+        empty = False
+        yield star.StarSchema(fact=fact, reviews=reviews, **dimensions)
+    if empty:
+        no_items = pd.DataFrame(columns=star.ITEM_COLUMNS).astype(
+            {"order_key": "int32", "product_key": "int32", "seller_key": "int32",
+             "order_item_id": "int64", "price": "float64", "freight_value": "float64"})
+        yield star.StarSchema(fact=star.assemble_fact(dimensions["orders"], no_items, reviews),
+                              reviews=reviews, **dimensions)
@@ -0,0 +1,424 @@
+"""Deterministic generator of Olist-shaped datasets for benchmarks.
+
+Writes all nine Olist CSVs at a multiple of the public dataset's size:
+
+    python dashboard/synth.py bench_data/10x --scale 10
+
+Order-level tables (orders, customers, items, reviews, payments) scale
+linearly; the catalog (products, sellers) grows with the square root of
+the scale, and the geolocation reference table is fixed, as in a real
+marketplace. Distributions follow the public dataset: orders per
+customer, items per order, review scores (lower on late deliveries),
+customer and seller zip prefixes by state, order status and delay rate.
+IDs are hashes of row numbers, and every random draw comes from a
+generator seeded per table and chunk, so a (seed, scale) pair always
+produces the same files.
+"""
+import binascii
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+import geo
+import ingest
+
+GENERATOR_VERSION = 1
+
+PAYMENTS_FILE = "order_payments_dataset.csv"
+
+# All nine Olist tables
+FILES = dict(ingest.DATA_FILES, payments=PAYMENTS_FILE, geolocation=geo.GEO_FILE)
+
+# Size of the public dataset, i.e. scale 1
+BASE_ORDERS = 99_441
+BASE_PRODUCTS = 32_951
+BASE_SELLERS = 3_095
+ZIP_PREFIXES = 19_015
+GEOLOCATION_ROWS = 1_000_163
+
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Orders are generated and appended to the CSVs in chunks of this size
+CHUNK_ORDERS = 250_000
+
+ORDERS_PER_CUSTOMER = ([1, 2, 3, 4, 5, 6], [0.9688, 0.0275, 0.0026, 0.0008, 0.0002, 0.0001])
+ITEMS_PER_ORDER = ([1, 2, 3, 4, 5, 6], [0.9003, 0.0757, 0.0128, 0.0052, 0.0042, 0.0018])
+REVIEWS_PER_ORDER = ([0, 1, 2], [0.0077, 0.9864, 0.0059])
+PAYMENTS_PER_ORDER = ([1, 2, 3], [0.9697, 0.0246, 0.0057])
+
+REVIEW_SCORES = [1, 2, 3, 4, 5]
+REVIEW_ON_TIME = [0.088, 0.028, 0.079, 0.204, 0.601]
+REVIEW_LATE = [0.460, 0.090, 0.120, 0.120, 0.210]
+
+ORDER_STATUS = (["delivered", "shipped", "canceled", "unavailable", "invoiced",
+                 "processing", "created", "approved"],
+                [0.97020, 0.01113, 0.00629, 0.00613, 0.00315, 0.00303, 0.00005, 0.00002])
+DELAY_RATE = 0.081
+
+PAYMENT_TYPES = (["credit_card", "boleto", "voucher", "debit_card"],
+                 [0.7392, 0.1904, 0.0556, 0.0148])
+
+# Orders per month in the public dataset, September 2016 to August 2018
+MONTHLY_ORDERS = [4, 324, 0, 1, 800, 1780, 2682, 2404, 3700, 3245, 4026, 4331, 4285, 4631,
+                  7544, 5673, 7269, 6728, 7211, 6939, 6873, 6167, 6292, 6512]
+FIRST_MONTH = "2016-09-01"
+
+# State, zip prefix range, share of customers, rough centroid (lat, lng)
+STATES = [
+    ("SP", 1000, 19999, 0.4198, -23.0, -47.0),
+    ("RJ", 20000, 28999, 0.1292, -22.5, -43.0),
+    ("MG", 30000, 39999, 0.1170, -19.0, -44.5),
+    ("RS", 90000, 99999, 0.0550, -29.8, -52.0),
+    ("PR", 80000, 87999, 0.0507, -25.0, -51.0),
+    ("SC", 88000, 89999, 0.0366, -27.2, -49.5),
+    ("BA", 40000, 48999, 0.0340, -12.9, -40.0),
+    ("DF", 70000, 72799, 0.0215, -15.8, -47.9),
+    ("ES", 29000, 29999, 0.0204, -20.0, -40.5),
+    ("GO", 72800, 76799, 0.0203, -16.5, -49.5),
+    ("PE", 50000, 56999, 0.0166, -8.3, -36.5),
+    ("CE", 60000, 63999, 0.0134, -4.5, -39.0),
+    ("PA", 66000, 68899, 0.0098, -3.0, -50.0),
+    ("MT", 78000, 78899, 0.0091, -14.0, -55.5),
+    ("MA", 65000, 65999, 0.0075, -4.5, -44.5),
+    ("MS", 79000, 79999, 0.0072, -20.5, -54.6),
+    ("PB", 58000, 58999, 0.0054, -7.2, -36.0),
+    ("PI", 64000, 64999, 0.0050, -6.0, -42.5),
+    ("RN", 59000, 59999, 0.0049, -5.8, -36.5),
+    ("AL", 57000, 57999, 0.0041, -9.6, -36.6),
+    ("SE", 49000, 49999, 0.0035, -10.6, -37.3),
+    ("TO", 77000, 77999, 0.0028, -10.2, -48.3),
+    ("RO", 76800, 76999, 0.0025, -10.8, -63.0),
+    ("AM", 69000, 69299, 0.0015, -3.1, -60.0),
+    ("AC", 69900, 69999, 0.0008, -9.9, -68.0),
+    ("AP", 68900, 68999, 0.0007, 0.5, -51.5),
+    ("RR", 69300, 69399, 0.0005, 2.8, -60.7),
+]
+
+REVIEW_MESSAGES = ["", "", "", "Recomendo", "Produto chegou antes do prazo, muito bom",
+                   "Ainda nao recebi o produto", "Otimo vendedor, entrega rapida",
+                   "Produto diferente do anunciado", "Tudo certo, gostei"]
+
+# Salt of the hashed IDs of each entity
+ID_SALTS = {"order": 1, "customer": 2, "customer_unique": 3, "product": 4,
+            "seller": 5, "review": 6}
+
+
+def _mix(x):
+    """splitmix64 finalizer over a uint64 array"""
+    x = x + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def hex_ids(keys, kind):
+    """Olist-style 32-char hex IDs for integer row numbers of an entity"""
+    keys = np.asarray(keys, dtype=np.uint64)
+    high = _mix(keys ^ np.uint64(ID_SALTS[kind] << 56))
+    low = _mix(high ^ keys)
+    raw = np.stack([high, low], axis=1).astype(">u8").tobytes()
+    return np.frombuffer(binascii.hexlify(raw), dtype="S32").astype(str)
+
+
+def _rng(seed, *stream):
+    return np.random.default_rng([seed, *stream])
+
+
+def _choice(rng, options, n):
+    values, p = options
+    p = np.asarray(p, dtype=float)
+    return rng.choice(np.asarray(values), size=n, p=p / p.sum())
+
+
+def _zipf_weights(n, a, rng):
+    """Popularity weights ~ 1/rank**a, shuffled over the n entities"""
+    weights = 1.0 / np.arange(1, n + 1) ** a
+    return rng.permutation(weights / weights.sum())
+
+
+def _state_shares(power=1.0):
+    shares = np.array([s[3] for s in STATES]) ** power
+    return shares / shares.sum()
+
+
+def build_zips(seed):
+    """Zip prefixes with their state index and popularity within the state"""
+    rng = _rng(seed, 0)
+    counts = np.maximum(5, np.round(_state_shares(0.7) * ZIP_PREFIXES)).astype(int)
+    zips, states = [], []
+    for i, (_, lo, hi, _, _, _) in enumerate(STATES):
+        n = min(counts[i], hi - lo + 1)
+        zips.append(np.sort(rng.choice(np.arange(lo, hi + 1), size=n, replace=False)))
+        states.append(np.full(n, i))
+    zips, states = np.concatenate(zips), np.concatenate(states)
+    popularity = np.concatenate([_zipf_weights(int((states == i).sum()), 0.8, rng)
+                                 for i in range(len(STATES))])
+    return zips, states, popularity
+
+
+def _sample_zips(rng, n, zips, states, popularity, state_p):
+    """Zip prefix and state index for n entities: state first, then zip within it"""
+    state = rng.choice(len(STATES), size=n, p=state_p)
+    zip_out = np.empty(n, dtype=np.int64)
+    for i in range(len(STATES)):
+        rows = np.flatnonzero(state == i)
+        if len(rows):
+            own = np.flatnonzero(states == i)
+            zip_out[rows] = rng.choice(zips[own], size=len(rows), p=popularity[own])
+    return zip_out, state
+
+
+def _city(zip_prefix):
+    return np.char.add("cidade ", (np.asarray(zip_prefix) // 100).astype(str))
+
+
+def build_geolocation(seed, zips, states, popularity):
+    """Geolocation rows: jittered points around a per-zip centre"""
+    rng = _rng(seed, 1)
+    per_zip = rng.poisson(popularity / popularity.sum() * GEOLOCATION_ROWS) + 1
+    lat0 = np.array([s[4] for s in STATES])[states] + rng.normal(0, 1.5, len(zips))
+    lng0 = np.array([s[5] for s in STATES])[states] + rng.normal(0, 1.5, len(zips))
+    rows = np.repeat(np.arange(len(zips)), per_zip)
+    return pd.DataFrame({
+        "geolocation_zip_code_prefix": zips[rows],
+        "geolocation_lat": lat0[rows] + rng.normal(0, 0.02, len(rows)),
+        "geolocation_lng": lng0[rows] + rng.normal(0, 0.02, len(rows)),
+        "geolocation_city": _city(zips[rows]),
+        "geolocation_state": np.array([s[0] for s in STATES])[states[rows]],
+    })
+
+
+def load_categories():
+    """Category translation table: the repo's copy when present, else generated names"""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data",
+                        ingest.DATA_FILES["category"])
+    if os.path.exists(path):
+        return pd.read_csv(path, encoding="utf-8-sig")
+    names = [f"categoria_{i:02d}" for i in range(71)]
+    return pd.DataFrame({"product_category_name": names,
+                         "product_category_name_english": [f"category_{i:02d}" for i in range(71)]})
+
+
+def build_sellers(seed, n, zips, states, popularity):
+    rng = _rng(seed, 2)
+    # Sellers concentrate in SP even more than customers do
+    zip_prefix, state = _sample_zips(rng, n, zips, states, popularity, _state_shares(1.6))
+    return pd.DataFrame({
+        "seller_id": hex_ids(np.arange(n), "seller"),
+        "seller_zip_code_prefix": zip_prefix,
+        "seller_city": _city(zip_prefix),
+        "seller_state": np.array([s[0] for s in STATES])[state],
+    })
+
+
+def build_products(seed, n, categories, n_sellers):
+    """Products plus the per-product seller, base price and sales popularity"""
+    rng = _rng(seed, 3)
+    category_p = _zipf_weights(len(categories), 1.0, rng)
+    category = categories["product_category_name"].to_numpy()[
+        rng.choice(len(categories), size=n, p=category_p)].astype(object)
+    category[rng.random(n) < 0.0185] = np.nan
+    weight = np.round(rng.lognormal(6.7, 1.2, n)).clip(2, 40_000)
+    products = pd.DataFrame({
+        "product_id": hex_ids(np.arange(n), "product"),
+        "product_category_name": category,
+        "product_name_lenght": rng.normal(48, 10, n).round().clip(5, 76),
+        "product_description_lenght": rng.lognormal(6.4, 0.75, n).round().clip(4, 3992),
+        "product_photos_qty": rng.geometric(0.45, n).clip(1, 20),
+        "product_weight_g": weight,
+        "product_length_cm": rng.normal(30, 14, n).round().clip(7, 105),
+        "product_height_cm": rng.lognormal(2.6, 0.75, n).round().clip(2, 105),
+        "product_width_cm": rng.normal(23, 10, n).round().clip(6, 118),
+    })
+    extra = {
+        "seller": rng.choice(n_sellers, size=n, p=_zipf_weights(n_sellers, 1.1, rng)),
+        "price": rng.lognormal(4.3, 0.95, n).round(2).clip(0.85, 6735),
+        "weight": weight,
+        "popularity": _zipf_weights(n, 0.9, rng),
+    }
+    return products, extra
+
+
+def _customer_assignment(seed, n_orders):
+    """Unique-customer index of each order, so orders per customer follow Olist"""
+    rng = _rng(seed, 4)
+    values, p = ORDERS_PER_CUSTOMER
+    mean = np.dot(values, p) / np.sum(p)
+    counts = _choice(rng, ORDERS_PER_CUSTOMER, int(n_orders / mean) + 1000)
+    counts = counts[:np.searchsorted(np.cumsum(counts), n_orders) + 1]
+    unique = rng.permutation(np.repeat(np.arange(len(counts)), counts))[:n_orders]
+    return unique, len(counts)
+
+
+def _timestamps(rng, n):
+    months = pd.date_range(FIRST_MONTH, periods=len(MONTHLY_ORDERS), freq="MS")
+    month = rng.choice(len(months), size=n, p=np.array(MONTHLY_ORDERS) / sum(MONTHLY_ORDERS))
+    start = months.to_numpy().astype("datetime64[s]")
+    seconds = (rng.random(n) * months.days_in_month.to_numpy()[month] * 86400).astype("int64")
+    return start[month] + seconds.astype("timedelta64[s]")
+
+
+def _days(values):
+    return (np.asarray(values) * 86400).astype("int64").astype("timedelta64[s]")
+
+
+def build_chunk(seed, chunk, order_rows, unique_of_order, customer_geo, products, product_extra):
+    """Customers, orders, items, reviews and payments for one chunk of orders"""
+    rng = _rng(seed, 10, chunk)
+    n = len(order_rows)
+    zip_prefix, state = customer_geo
+    unique = unique_of_order[order_rows]
+
+    customers = pd.DataFrame({
+        "customer_id": hex_ids(order_rows, "customer"),
+        "customer_unique_id": hex_ids(unique, "customer_unique"),
+        "customer_zip_code_prefix": zip_prefix[unique],
+        "customer_city": _city(zip_prefix[unique]),
+        "customer_state": np.array([s[0] for s in STATES])[state[unique]],
+    })
+
+    purchase = _timestamps(rng, n)
+    status = _choice(rng, ORDER_STATUS, n)
+    approved = purchase + _days(rng.exponential(0.4, n))
+    carrier = approved + _days(rng.gamma(2.0, 1.4, n))
+    estimated_days = rng.integers(15, 36, n)
+    estimated = (purchase + _days(estimated_days)).astype("datetime64[D]").astype("datetime64[s]")
+    late = rng.random(n) < DELAY_RATE
+    on_time_days = estimated_days * rng.beta(3.0, 2.4, n)
+    late_days = estimated_days + 1 + rng.gamma(1.5, 6.0, n)
+    delivered = purchase + _days(np.where(late, late_days, on_time_days))
+    is_delivered = status == "delivered"
+    not_shipped = np.isin(status, ["created", "approved", "processing", "invoiced",
+                                   "canceled", "unavailable"])
+    orders = pd.DataFrame({
+        "order_id": hex_ids(order_rows, "order"),
+        "customer_id": customers["customer_id"].to_numpy(),
+        "order_status": status,
+        "order_purchase_timestamp": purchase,
+        "order_approved_at": np.where(status == "created", np.datetime64("NaT"), approved),
+        "order_delivered_carrier_date": np.where(not_shipped, np.datetime64("NaT"), carrier),
+        "order_delivered_customer_date": np.where(is_delivered, delivered, np.datetime64("NaT")),
+        "order_estimated_delivery_date": estimated,
+    })
+
+    n_items = _choice(rng, ITEMS_PER_ORDER, n)
+    item_order = np.repeat(np.arange(n), n_items)
+    starts = np.cumsum(n_items) - n_items
+    item_number = np.arange(len(item_order)) - np.repeat(starts, n_items) + 1
+    product = rng.choice(len(products), size=len(item_order), p=product_extra["popularity"])
+    # Multi-item orders often repeat the same product
+    repeat = (item_number > 1) & (rng.random(len(item_order)) < 0.6)
+    product[repeat] = product[np.flatnonzero(repeat) - 1]
+    freight = (8 + product_extra["weight"][product] / 1000 * 2.2 +
+               rng.gamma(2.0, 3.0, len(item_order))).round(2)
+    items = pd.DataFrame({
+        "order_id": orders["order_id"].to_numpy()[item_order],
+        "order_item_id": item_number,
+        "product_id": products["product_id"].to_numpy()[product],
+        "seller_id": hex_ids(product_extra["seller"][product], "seller"),
+        "shipping_limit_date": approved[item_order] + _days(6),
+        "price": product_extra["price"][product],
+        "freight_value": freight,
+    })
+
+    n_reviews = _choice(rng, REVIEWS_PER_ORDER, n)
+    review_order = np.repeat(np.arange(n), n_reviews)
+    unhappy = (late | ~is_delivered)[review_order]
+    score = np.where(unhappy, _choice(rng, (REVIEW_SCORES, REVIEW_LATE), len(review_order)),
+                     _choice(rng, (REVIEW_SCORES, REVIEW_ON_TIME), len(review_order)))
+    created = np.where(is_delivered, delivered, estimated)[review_order].astype("datetime64[D]")
+    created = (created + np.timedelta64(1, "D")).astype("datetime64[s]")
+    review_rows = chunk * CHUNK_ORDERS * 3 + np.arange(len(review_order))
+    reviews = pd.DataFrame({
+        "review_id": hex_ids(review_rows, "review"),
+        "order_id": orders["order_id"].to_numpy()[review_order],
+        "review_score": score,
+        "review_comment_title": np.where(rng.random(len(review_order)) < 0.12, "Recomendo", ""),
+        "review_comment_message": rng.choice(REVIEW_MESSAGES, size=len(review_order)),
+        "review_creation_date": created,
+        "review_answer_timestamp": created + _days(rng.exponential(3.0, len(review_order))),
+    })
+
+    order_value = np.bincount(item_order, weights=items["price"] + items["freight_value"], minlength=n)
+    n_payments = _choice(rng, PAYMENTS_PER_ORDER, n)
+    payment_order = np.repeat(np.arange(n), n_payments)
+    payment_starts = np.cumsum(n_payments) - n_payments
+    payment_type = _choice(rng, PAYMENT_TYPES, len(payment_order))
+    installments = np.where(payment_type == "credit_card",
+                            rng.choice([1, 2, 3, 4, 5, 6, 8, 10], size=len(payment_order),
+                                       p=[.5, .12, .1, .08, .06, .05, .05, .04]), 1)
+    payments = pd.DataFrame({
+        "order_id": orders["order_id"].to_numpy()[payment_order],
+        "payment_sequential": np.arange(len(payment_order)) - np.repeat(payment_starts, n_payments) + 1,
+        "payment_type": payment_type,
+        "payment_installments": installments,
+        "payment_value": (order_value[payment_order] / n_payments[payment_order]).round(2),
+    })
+    return {"customers": customers, "orders": orders, "order_items": items,
+            "reviews": reviews, "payments": payments}
+
+
+def generate(out_dir, scale=1.0, seed=0):
+    """Write all nine Olist CSVs for ``scale`` into ``out_dir``; returns row counts"""
+    os.makedirs(out_dir, exist_ok=True)
+    n_orders = max(1, round(BASE_ORDERS * scale))
+    n_products = max(10, round(BASE_PRODUCTS * scale ** 0.5))
+    n_sellers = max(5, round(BASE_SELLERS * scale ** 0.5))
+    counts = {}
+
+    def write(name, df, append=False):
+        df.to_csv(os.path.join(out_dir, FILES[name]), index=False, date_format=DATE_FORMAT,
+                  mode="a" if append else "w", header=not append)
+        counts[name] = counts.get(name, 0) + len(df) if append else len(df)
+
+    zips, states, popularity = build_zips(seed)
+    write("geolocation", build_geolocation(seed, zips, states, popularity))
+    categories = load_categories()
+    write("category", categories)
+    write("sellers", build_sellers(seed, n_sellers, zips, states, popularity))
+    products, product_extra = build_products(seed, n_products, categories, n_sellers)
+    write("products", products)
+
+    unique_of_order, n_unique = _customer_assignment(seed, n_orders)
+    customer_geo = _sample_zips(_rng(seed, 5), n_unique, zips, states, popularity, _state_shares())
+    for chunk, start in enumerate(range(0, n_orders, CHUNK_ORDERS)):
+        order_rows = np.arange(start, min(start + CHUNK_ORDERS, n_orders))
+        tables = build_chunk(seed, chunk, order_rows, unique_of_order, customer_geo,
+                             products, product_extra)
+        for name, df in tables.items():
+            write(name, df, append=chunk > 0)
+
+    with open(os.path.join(out_dir, "synth.json"), "w") as f:
+        json.dump({"version": GENERATOR_VERSION, "scale": scale, "seed": seed, "rows": counts}, f, indent=2)
+    return counts
+
+
+def ensure_dataset(out_dir, scale=1.0, seed=0):
+    """Generate ``out_dir`` unless it already holds this (version, scale, seed)"""
+    try:
+        with open(os.path.join(out_dir, "synth.json")) as f:
+            info = json.load(f)
+        if (info["version"], info["scale"], info["seed"]) == (GENERATOR_VERSION, scale, seed):
+            return info["rows"]
+    except (OSError, ValueError, KeyError):
+        pass
+    return generate(out_dir, scale, seed)
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Generate an Olist-shaped synthetic dataset")
+    parser.add_argument("out_dir")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiple of the public dataset size")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    counts = generate(args.out_dir, args.scale, args.seed)
+    for name, rows in counts.items():
+        print(f"{FILES[name]:<42} {rows:>12,}")
+    print(f"generated in {time.perf_counter() - start:.1f}s")
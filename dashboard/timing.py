@@ -0,0 +1,141 @@
+"""Wall-clock and CPU timing spans for the dashboard's hot paths.
+
+Code marks its stages with ``span``:
+
+    with timing.span("groupby"):
+        ...
+
+Spans are recorded only while a Profiler is active (one per dashboard
+rerun, or around a benchmark run); otherwise ``span`` does nothing, so
+report.py and the other modules can stay instrumented in batch jobs.
+Spans nest, so a page span contains its loader and chart spans.
+
+A Profiler can append its spans to a JSON-lines log; ``summarize`` (or
+``python dashboard/timing.py timings.jsonl``) turns that log into p50/p95
+latency per page and span.
+"""
+import contextlib
+import contextvars
+import datetime
+import json
+import time
+
+import pandas as pd
+
+# Set DASHBOARD_TIMING_LOG to append one JSON line per dashboard rerun
+LOG_ENV = "DASHBOARD_TIMING_LOG"
+
+_current = contextvars.ContextVar("profiler", default=None)
+
+
+class Profiler:
+    """Collects the spans run while it is active, in start order"""
+
+    def __init__(self):
+        self.spans = []
+        self._depth = 0
+        self._start = time.perf_counter()
+        self._token = None
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, *exc):
+        _current.reset(self._token)
+        return False
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self._start
+
+    @contextlib.contextmanager
+    def span(self, name):
+        record = {"name": name, "depth": self._depth,
+                  "start_s": time.perf_counter() - self._start}
+        self.spans.append(record)
+        self._depth += 1
+        start, start_cpu = time.perf_counter(), time.process_time()
+        try:
+            yield record
+        finally:
+            record["wall_s"] = time.perf_counter() - start
+            record["cpu_s"] = time.process_time() - start_cpu
+            self._depth -= 1
+
+    def table(self):
+        """Spans as a DataFrame, names indented by nesting depth.
+
+        ``self_s`` is a span's wall time not covered by its child spans,
+        e.g. the figure building and widgets of a page.
+        """
+        df = pd.DataFrame(self.spans, columns=["name", "depth", "start_s", "wall_s", "cpu_s"])
+        children = [0.0] * len(df)
+        parents = []
+        for i, depth in enumerate(df["depth"]):
+            del parents[depth:]
+            if parents:
+                children[parents[-1]] += df["wall_s"].iat[i]
+            parents.append(i)
+        df["self_s"] = df["wall_s"] - children
+        df["name"] = [" " * 2 * depth + name for name, depth in zip(df["name"], df["depth"])]
+        return df.drop(columns="depth")
+
+    def record(self, **fields):
+        """This rerun as one log record: ``fields`` plus total time and spans"""
+        return dict(fields, ts=datetime.datetime.now().isoformat(timespec="milliseconds"),
+                    total_s=round(self.elapsed, 6),
+                    spans=[{k: round(v, 6) if isinstance(v, float) else v for k, v in s.items()}
+                           for s in self.spans])
+
+    def write_log(self, path, **fields):
+        """Append ``record(**fields)`` to the JSON-lines log at ``path``"""
+        with open(path, "a") as f:
+            f.write(json.dumps(self.record(**fields), default=str) + "\n")
+
+
+@contextlib.contextmanager
+def span(name):
+    """Time the block under ``name`` in the active Profiler, if any"""
+    profiler = _current.get()
+    if profiler is None:
+        yield None
+    else:
+        with profiler.span(name) as record:
+            yield record
+
+
+def read_log(path):
+    """One row per span per logged rerun, with the rerun's page and total"""
+    rows = []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            page = entry.get("page")
+            rows.append({"page": page, "span": "(total)", "wall_s": entry["total_s"], "cpu_s": None})
+            for s in entry["spans"]:
+                rows.append({"page": page, "span": s["name"], "wall_s": s["wall_s"], "cpu_s": s["cpu_s"]})
+    return pd.DataFrame(rows, columns=["page", "span", "wall_s", "cpu_s"])
+
+
+def summarize(path):
+    """Count, p50, p95 and max wall time per page and span of a timing log"""
+    df = read_log(path)
+    grouped = df.groupby(["page", "span"], sort=False)["wall_s"]
+    return pd.DataFrame({
+        "count": grouped.size(),
+        "p50_s": grouped.quantile(0.5),
+        "p95_s": grouped.quantile(0.95),
+        "max_s": grouped.max(),
+    })
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) != 2:
+        sys.exit("usage: timing.py TIMING_LOG.jsonl")
+    with pd.option_context("display.max_rows", None, "display.max_columns", None, "display.width", 120):
+        print(summarize(sys.argv[1]).round(4))